@@ -1,17 +1,24 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
+import queue
 import re
-from typing import Any, Dict, Optional, Tuple
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import lru_cache, partial
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, NamedTuple, Optional, Set, Tuple
 from urllib.parse import quote
 
-import requests
+import httpx
+import orjson
 from dotenv import load_dotenv
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InlineQuery,
     InlineQueryResultArticle,
     InlineQueryResultsButton,
     InputTextMessageContent,
@@ -59,34 +66,451 @@ from .delivery import (
     DELIVERY_CONFIRM_CALLBACK,
     DELIVERY_APPROVE_QUERY_PREFIXES,
 )
+from .parsing import (
+    WAREHOUSE_FIELDS,
+    find_token_value,
+    parse_item_inline,
+    parse_labelled_inline,
+    parse_number,
+)
 from .storage import StockStorage
 
 logger = logging.getLogger(__name__)
 
 ENTRY_TRIGGER = "entry"
 ENTRY_CALLBACK_CREATE = "entry:create"
+ENTRY_CONFIRM_CALLBACK = "entry:confirm"
 ENTRY_APPROVE_PREFIX = "entry-approve"
 ENTRY_CANCEL_PREFIX = "entry-cancel"
 ENTRY_DELETE_PREFIX = "entry-delete"
 ENTRY_CREATE_PREFIX = "entrycreate"
 ENTRY_APPROVE_QUERY_PREFIXES = ("entryapprove", "approve")
 ENTRY_DISMISS_PREFIX = "entry-dismiss"
-ENTRY_TYPE_OPTIONS = {
-    "receipt": {
-        "label": "Material kiridi",
-        "value": "Material Receipt",
-        "warehouse_role": "target",
-    },
-    "issue": {
-        "label": "Material chiqdi",
-        "value": "Material Issue",
-        "warehouse_role": "source",
-    },
+ENTRY_ITEM_MARKERS = ("item code", "buyum kodi", "#entryitem")
+
+
+class EntryTypeOption(NamedTuple):
+    key: str
+    label: str
+    value: str
+    warehouse_role: str
+
+
+ENTRY_TYPE_OPTIONS = (
+    EntryTypeOption("receipt", "Material kiridi", "Material Receipt", "target"),
+    EntryTypeOption("issue", "Material chiqdi", "Material Issue", "source"),
+)
+ENTRY_TYPE_BY_KEY = {option.key: option for option in ENTRY_TYPE_OPTIONS}
+ENTRY_WAREHOUSE_FIELDS = {
+    "target": ("t_warehouse", "to_warehouse"),
+    "source": ("s_warehouse", "from_warehouse"),
 }
+DOCSTATUS_LABELS = ("Draft", "Tasdiqlangan", "Bekor qilingan")
+STOCK_ENTRY_RESOURCE = "/api/resource/" + quote("Stock Entry", safe="")
+ITEM_LIST_FIELDS = orjson.dumps(
+    ["name", "item_code", "item_name", "item_group", "stock_uom", "description", "standard_rate"]
+).decode()
+ITEM_PICKER_FIELDS = orjson.dumps(["name", "item_code", "item_name", "stock_uom"]).decode()
+WAREHOUSE_LIST_FIELDS = orjson.dumps(["name", "warehouse_name"]).decode()
+SUPPLIER_LIST_FIELDS = orjson.dumps(["name", "supplier_name", "supplier_group"]).decode()
+STOCK_ENTRY_LIST_FIELDS = orjson.dumps(
+    [
+        "name",
+        "purpose",
+        "stock_entry_type",
+        "posting_date",
+        "posting_time",
+        "from_warehouse",
+        "to_warehouse",
+        "total_outgoing_value",
+        "total_incoming_value",
+        "docstatus",
+    ]
+).decode()
+ENTRY_TYPE_LABELS = {
+    "Material Receipt": "Kirim",
+    "Material Issue": "Chiqim",
+}
+ENTRY_PREVIEW_TEMPLATE = "• %s — %s (%s, %s → %s) — %s"
+ITEM_PICKER_TEMPLATE = "%s\n📦 %s\nBuyum kodi: %s\nUOM: %s"
+LABELLED_PICKER_TEMPLATE = "%s\n%s: %s\n%s: %s"
+STOCK_ENTRY_HEADER_TEMPLATE = (
+    "🚚 Stock Entry: %s\n"
+    "Maqsad: %s\n"
+    "Tur: %s\n"
+    "Sana: %s %s\n"
+    "Source Warehouse: %s\n"
+    "Target Warehouse: %s\n"
+    "Qiymat: chiqish %s, kirish %s\n"
+    "Status: %s"
+)
+PURCHASE_RECEIPT_HEADER_TEMPLATE = (
+    "🧾 Kirim hujjati: %s\nYetkazib beruvchi: %s\nSana: %s %s\nOmbor: %s\nJami: %s\nStatus: %s"
+)
+STOCK_ENTRY_ROW_TEMPLATE = "• %s %s — %s (%s → %s)"
+PURCHASE_RECEIPT_ROW_TEMPLATE = "• %s %s — Qabul: %s, Reject: %s, Rate: %s"
+ITEM_HEADER_TEMPLATE = "📦 Buyum: %s\nKod: %s\nGuruhi: %s\nO'lchov birligi: %s"
+ENTRY_APPROVE_RESULT_TEMPLATE = (
+    "#entryapprove\nStock Entry: %s\nHarakat turi: %s\nStatus: %s\n" + ENTRY_APPROVE_PREFIX + ":%s"
+)
+PURCHASE_APPROVE_RESULT_TEMPLATE = (
+    "#purchaseapprove\nKirim hujjati: %s\nYetkazib beruvchi: %s\nStatus: %s\n" + PURCHASE_APPROVE_PREFIX + ":%s"
+)
+DELIVERY_APPROVE_RESULT_TEMPLATE = (
+    "#deliveryapprove\nChiqqan mahsulot hujjati: %s\nCustomer: %s\nStatus: %s\n" + DELIVERY_APPROVE_PREFIX + ":%s"
+)
 
 FORMALIZE_INCOMING_CALLBACK = "formalize:incoming"
 FORMALIZE_OUTGOING_CALLBACK = "formalize:outgoing"
 
+CALLBACK_EXACT_ROUTES = {
+    ENTRY_CALLBACK_CREATE: "handle_entry_create_callback",
+    ENTRY_CONFIRM_CALLBACK: "handle_entry_confirm_callback",
+    PURCHASE_CALLBACK_CREATE: "handle_purchase_create_callback",
+    PURCHASE_CONFIRM_CALLBACK: "handle_purchase_confirm_callback",
+    DELIVERY_CALLBACK_CREATE: "handle_delivery_create_callback",
+    DELIVERY_CONFIRM_CALLBACK: "handle_delivery_confirm_callback",
+}
+CALLBACK_PREFIX_ROUTES = {
+    "item": "handle_item_callback",
+    "entry-detail": "handle_entry_detail_callback",
+    ENTRY_CREATE_PREFIX: "handle_entry_creation_callback",
+    "formalize": "handle_formalize_callback",
+    PURCHASE_CREATE_PREFIX: "handle_purchase_creation_callback",
+    PURCHASE_APPROVE_PREFIX: "handle_purchase_approve_action",
+    PURCHASE_CANCEL_PREFIX: "handle_purchase_cancel_action",
+    PURCHASE_DELETE_PREFIX: "handle_purchase_delete_action",
+    PURCHASE_DISMISS_PREFIX: "handle_purchase_dismiss_action",
+    DELIVERY_CREATE_PREFIX: "handle_delivery_creation_callback",
+    DELIVERY_APPROVE_PREFIX: "handle_delivery_approve_action",
+    DELIVERY_CANCEL_PREFIX: "handle_delivery_cancel_action",
+    DELIVERY_DELETE_PREFIX: "handle_delivery_delete_action",
+    DELIVERY_DISMISS_PREFIX: "handle_delivery_dismiss_action",
+    ENTRY_APPROVE_PREFIX: "handle_entry_approve_callback",
+    ENTRY_CANCEL_PREFIX: "handle_entry_cancel_callback",
+    ENTRY_DELETE_PREFIX: "handle_entry_delete_callback",
+    ENTRY_DISMISS_PREFIX: "handle_entry_dismiss_callback",
+}
+
+MENU_BUTTON_ACTIONS = {
+    "📦 Buyumlar": "_open_items_menu",
+    "📦 Buyumlarni ko'rish": "_open_items_menu",
+    "📦 Itemlar": "_open_items_menu",
+    "📦 Itemlarni ko'rish": "_open_items_menu",
+    "📋 harakatlar": "_open_entries_menu",
+    "harakatlar": "_open_entries_menu",
+    "📝 Rasmiylashtirish": "_open_formalization_menu",
+    "rasmiylashtirish": "_open_formalization_menu",
+    "🧾 Kirim hujjati": "_open_purchase_menu",
+    "📥 Kirgan mahsulotni rasmiylashtirish": "_open_purchase_menu",
+    "kirim hujjati": "_open_purchase_menu",
+    "kirim": "_open_purchase_menu",
+    "kirgan mahsulotni rasmiylashtirish": "_open_purchase_menu",
+    "🚚 Chiqqan mahsulot hujjati": "_open_delivery_menu",
+    "📤 Chiqqan mahsulotni rasmiylashtirish": "_open_delivery_menu",
+    "chiqqan mahsulot hujjati": "_open_delivery_menu",
+    "chiqim": "_open_delivery_menu",
+    "chiqqan mahsulotni rasmiylashtirish": "_open_delivery_menu",
+}
+
+ENTRY_STAGE_HANDLERS = {
+    "await_item_message": "_handle_entry_item_message",
+    "await_warehouse_message": "_handle_entry_warehouse_message",
+    "await_qty": "_handle_entry_quantity_message",
+}
+
+DRAFT_FLOW_HANDLERS = {
+    "purchase_receipt": "_handle_purchase_receipt_message",
+    "delivery_note": "_handle_delivery_note_message",
+}
+
+DRAFT_APPROVE_HANDLERS = {
+    ("stock_entry", "await_approve"): "_handle_entry_approve_message",
+    ("purchase_confirm", "await_purchase_confirm"): "_handle_purchase_approve_message",
+    ("delivery_confirm", "await_delivery_confirm"): "_handle_delivery_approve_message",
+}
+
+DRAFT_PENDING_HINTS = {
+    "purchase_confirm": (
+        "Kirim hujjatini tasdiqlash jarayoni davom etmoqda.\n"
+        "Inline menyudan #purchaseapprove natijasini yuboring yoki /cancel deb yozib bekor qiling."
+    ),
+    "delivery_confirm": (
+        "Chiqqan mahsulot hujjatini tasdiqlash jarayoni davom etmoqda.\n"
+        "Inline menyundan #deliveryapprove natijasini yuboring yoki /cancel deb yozib bekor qiling."
+    ),
+}
+
+DRAFT_SWEEP_INTERVAL = 600
+REFRESH_COOLDOWN = 2.0
+REFRESH_TRACK_LIMIT = 1024
+DETAIL_CACHE_TTL = 5.0
+DETAIL_CACHE_SIZE = 512
+LIST_CACHE_TTL = 2.0
+LIST_CACHE_SIZE = 256
+REFERENCE_LIST_TTL = 30.0
+ERP_BREAKER_THRESHOLD = 5
+ERP_BREAKER_COOLDOWN = 30.0
+DetailResult = Tuple[bool, Optional[str], Dict[str, Any]]
+
+TOKEN_RE = re.compile(r"[A-Za-z0-9]{14,18}")
+WHITESPACE_RE = re.compile(r"\s+")
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+ACTION_ERROR_RE = re.compile(
+    r"(?=.*?(?P<linked>cannot delete or cancel))|(?=.*?(?P<negative>negativestockerror|negative stock))",
+    re.I | re.S,
+)
+ACTION_ERROR_REASONS = {
+    "linked": (
+        "Bu hujjat ERPNext dagi boshqa hujjatlar (masalan, GL Entry yoki boshqa Stock Entry) bilan bog'langan. "
+        "Avval ularni bekor qilmasdan turib bu amaliyotni bajarib bo'lmaydi."
+    ),
+    "negative": "Omborda yetarli qoldiq yo'q, shuning uchun ERPNext amaliyotni rad etdi.",
+}
+
+ITEMS_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("📦 Buyumlarni ko'rish", switch_inline_query_current_chat="items")]]
+)
+MAIN_MENU_MARKUP = ReplyKeyboardMarkup(
+    [
+        ["📦 Buyumlar", "📋 Harakatlar"],
+        ["📝 Rasmiylashtirish"],
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=False,
+)
+FORMALIZATION_OPTIONS_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton(
+                "📥 Kirgan mahsulotni rasmiylashtirish",
+                callback_data=FORMALIZE_INCOMING_CALLBACK,
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                "📤 Chiqqan mahsulotni rasmiylashtirish",
+                callback_data=FORMALIZE_OUTGOING_CALLBACK,
+            )
+        ],
+    ]
+)
+ENTRY_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("➕ Yangi harakat yaratish", callback_data=ENTRY_CALLBACK_CREATE)],
+        [InlineKeyboardButton("✔️ Harakatni tasdiqlash", callback_data=ENTRY_CONFIRM_CALLBACK)],
+    ]
+)
+ENTRY_APPROVE_INLINE_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton(
+                "📋 Tasdiqlash oynasini ochish",
+                switch_inline_query_current_chat=ENTRY_APPROVE_QUERY_PREFIXES[0],
+            )
+        ]
+    ]
+)
+DEFAULT_START_LABEL = "Botni ochish"
+START_REQUIRED_BUTTON = InlineQueryResultsButton(text="Avval /start ni bosing", start_parameter="start")
+EMPTY_ITEM_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("Yangilash", callback_data="item:refresh")]])
+EMPTY_ENTRY_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("Yangilash", callback_data="entry-detail:refresh")]]
+)
+
+
+INLINE_QUERY_MODES = {
+    ENTRY_TRIGGER: "entry",
+    "entryitem": "entry_item",
+    "itemlookup": "entry_item",
+    "entrywarehouse": "entry_warehouse",
+    "warehouse": "entry_warehouse",
+    **{prefix: "entry_approve" for prefix in ENTRY_APPROVE_QUERY_PREFIXES},
+    PURCHASE_TRIGGER: "purchase",
+    **{prefix: "purchase_approve" for prefix in PURCHASE_APPROVE_QUERY_PREFIXES},
+    PURCHASE_ITEM_QUERY_PREFIX: "purchase_item",
+    PURCHASE_SUPPLIER_QUERY_PREFIX: "supplier",
+    DELIVERY_TRIGGER: "delivery",
+    **{prefix: "delivery_approve" for prefix in DELIVERY_APPROVE_QUERY_PREFIXES},
+    DELIVERY_ITEM_QUERY_PREFIX: "delivery_item",
+    DELIVERY_CUSTOMER_QUERY_PREFIX: "customer",
+}
+
+
+def _compress_edges(node: Dict[str, Any]) -> Dict[str, Any]:
+    compressed: Dict[str, Any] = {}
+    for char, child in node.items():
+        if not char:
+            compressed[char] = child
+            continue
+        label = char
+        while "" not in child and len(child) == 1:
+            ((next_char, child),) = child.items()
+            label += next_char
+        compressed[char] = (label, _compress_edges(child))
+    return compressed
+
+
+def _build_prefix_trie(modes: Dict[str, str]) -> Dict[str, Any]:
+    root: Dict[str, Any] = {}
+    for prefix, mode in modes.items():
+        node = root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[""] = (mode, prefix)
+    return _compress_edges(root)
+
+
+INLINE_PREFIX_TRIE = _build_prefix_trie(INLINE_QUERY_MODES)
+
+
+class ItemPickerSpec(NamedTuple):
+    tag: str
+    id_prefix: str
+
+
+class LabelledPickerSpec(NamedTuple):
+    fetch: str
+    limit_setting: str
+    error_hint: str
+    tag: str
+    id_prefix: str
+    label_fields: Tuple[str, ...]
+    label_caption: str
+    code_caption: str
+
+
+ITEM_PICKER_SPECS = {
+    "entry_item": ItemPickerSpec("#entryitem", "entryitem"),
+    "purchase_item": ItemPickerSpec("#pritem", "purchaseitem"),
+    "delivery_item": ItemPickerSpec("#dnitem", "deliveryitem"),
+}
+
+LABELLED_PICKER_SPECS = {
+    "entry_warehouse": LabelledPickerSpec(
+        "_fetch_warehouses",
+        "warehouse_limit",
+        "Ombor ro'yxatini olishda xatolik",
+        "#entrywarehouse",
+        "entrywarehouse",
+        ("warehouse_name",),
+        "Warehouse",
+        "Code",
+    ),
+    "supplier": LabelledPickerSpec(
+        "_fetch_suppliers",
+        "supplier_limit",
+        "Yetkazib beruvchilar ro'yxatini olishda xatolik",
+        "#supplier",
+        "supplier",
+        ("supplier_name", "supplier_group"),
+        "Yetkazib beruvchi",
+        "Kod",
+    ),
+    "customer": LabelledPickerSpec(
+        "_fetch_customers",
+        "customer_limit",
+        "Customer ro'yxatini olishda xatolik",
+        "#customer",
+        "customer",
+        ("customer_name", "customer_group"),
+        "Customer",
+        "Code",
+    ),
+}
+
+ITEM_LIST_QUERIES = frozenset({"items", "bot items"})
+
+INLINE_MODE_HANDLERS = {
+    "entry": "_inline_entries",
+    "entry_approve": "_inline_entry_approvals",
+    "purchase": "_inline_purchase_receipts",
+    "purchase_approve": "_inline_purchase_approvals",
+    "delivery": "_inline_delivery_notes",
+    "delivery_approve": "_inline_delivery_approvals",
+}
+
+
+def match_inline_prefix(query: str) -> Tuple[Optional[str], str]:
+    head = query.partition(" ")[0]
+    mode = INLINE_QUERY_MODES.get(head)
+    if mode:
+        return mode, head
+    node = INLINE_PREFIX_TRIE
+    match: Tuple[Optional[str], str] = (None, "")
+    pos = 0
+    while pos < len(query):
+        edge = node.get(query[pos])
+        if edge is None or not query.startswith(edge[0], pos):
+            break
+        label, node = edge
+        pos += len(label)
+        match = node.get("", match)
+    return match
+
+
+@lru_cache(maxsize=8)
+def _cancel_creation_button(prefix: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton("❌ Jarayonni bekor qilish", callback_data=f"{prefix}:cancel")
+
+
+@lru_cache(maxsize=8)
+def _cancel_creation_markup(prefix: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[_cancel_creation_button(prefix)]])
+
+
+def _erp_error_detail(response: httpx.Response) -> str:
+    try:
+        body = orjson.loads(response.content)
+    except ValueError:
+        return response.text
+    if not isinstance(body, dict):
+        return str(body)
+    return body.get("message") or body.get("exception") or body.get("_server_messages") or str(body)
+
+
+def _auth_headers(api_key: str, api_secret: str) -> Dict[str, str]:
+    return {"Authorization": f"token {api_key}:{api_secret}"}
+
+
+def _json_auth_headers(api_key: str, api_secret: str) -> Dict[str, str]:
+    return {"Authorization": f"token {api_key}:{api_secret}", "Content-Type": "application/json"}
+
+
+@lru_cache(maxsize=64)
+def _inline_start_button(text: str) -> InlineQueryResultsButton:
+    label = text.strip()[:48] if text else ""
+    return InlineQueryResultsButton(text=label or DEFAULT_START_LABEL, start_parameter="start")
+
+
+@lru_cache(maxsize=8)
+def _docstatus_text(value: Optional[int]) -> str:
+    if value in (0, 1, 2):
+        return DOCSTATUS_LABELS[value]
+    return "Noma'lum"
+
+
+@lru_cache(maxsize=1024)
+def _strip_html(value: str) -> str:
+    return HTML_TAG_RE.sub(" ", value).strip()
+
+
+@lru_cache(maxsize=512)
+def _entry_action_markup(docname: str, docstatus: Optional[int]) -> InlineKeyboardMarkup:
+    if docstatus == 0:
+        buttons = [
+            [
+                InlineKeyboardButton("✅ Tasdiqlash", callback_data=f"{ENTRY_APPROVE_PREFIX}:{docname}"),
+                InlineKeyboardButton("🗑️ O'chirish", callback_data=f"{ENTRY_DELETE_PREFIX}:{docname}"),
+            ],
+            [InlineKeyboardButton("📁 Saqlab chiqish", callback_data=f"{ENTRY_DISMISS_PREFIX}:{docname}")],
+        ]
+    elif docstatus == 1:
+        buttons = [[InlineKeyboardButton("❌ Bekor qilish", callback_data=f"{ENTRY_CANCEL_PREFIX}:{docname}")]]
+    else:
+        buttons = [[InlineKeyboardButton("🗑️ O'chirish", callback_data=f"{ENTRY_DELETE_PREFIX}:{docname}")]]
+    return InlineKeyboardMarkup(buttons)
+
 
 class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
     """Telegram bot that verifies ERPNext API keys and lists Item records."""
@@ -97,20 +521,113 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         self.application = (
             Application.builder()
             .token(config.token)
-            .rate_limiter(AIORateLimiter())
+            .rate_limiter(
+                AIORateLimiter(
+                    overall_max_rate=30,
+                    overall_time_period=1,
+                    group_max_rate=18,
+                    group_time_period=60,
+                    max_retries=3,
+                )
+            )
             .post_init(self._post_init)
+            .post_stop(self._post_stop)
             .build()
         )
+        self._http = httpx.AsyncClient(
+            base_url=config.frappe_base_url,
+            http2=True,
+            headers={"Accept": "application/json"},
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=75.0,
+            ),
+        )
         self._register_handlers()
         self._bot_username: Optional[str] = None
+        self._draft_reaper: Optional[asyncio.Task] = None
+        self._last_refresh: Dict[Tuple[int, str], float] = {}
+        self._erp_slots = asyncio.Semaphore(config.erp_concurrency)
+        self._erp_failures = 0
+        self._erp_open_until = 0.0
+        self._detail_slots = asyncio.Semaphore(config.detail_concurrency)
+        self._detail_cache: OrderedDict[Tuple[str, str, str], Tuple[float, DetailResult]] = OrderedDict()
+        self._detail_inflight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        self._list_cache: OrderedDict[Tuple[Any, ...], Tuple[float, List[Dict[str, Any]]]] = OrderedDict()
+        self._list_inflight: Dict[Tuple[Any, ...], asyncio.Task] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
 
     async def _post_init(self, application: Application) -> None:
-        me = await application.bot.get_me()
+        me = application.bot.bot
         self._bot_username = me.username
         logger.info("Stock manager bot connected as %s (@%s)", me.full_name, me.username)
+        self._draft_reaper = asyncio.create_task(self._reap_stale_drafts())
+
+    async def _post_stop(self, application: Application) -> None:
+        if self._draft_reaper:
+            self._draft_reaper.cancel()
+        await self._http.aclose()
+
+    def _spawn(self, coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    @staticmethod
+    async def _settle(task: Optional[asyncio.Task]) -> None:
+        if task is None:
+            return
+        try:
+            await task
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Oraliq xabarni yuborib bo'lmadi: %s", exc)
+
+    async def _reap_stale_drafts(self) -> None:
+        max_age = timedelta(minutes=self.config.draft_ttl_minutes)
+        while True:
+            await asyncio.sleep(DRAFT_SWEEP_INTERVAL)
+            try:
+                removed = self.storage.delete_stale_entry_drafts(max_age)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Eskirgan draftlarni o'chirishda xatolik: %s", exc)
+                continue
+            if removed:
+                logger.info("Removed %s stale entry drafts", removed)
 
     def _register_handlers(self) -> None:
         app = self.application
+        self._callback_exact_routes = {
+            data: getattr(self, name) for data, name in CALLBACK_EXACT_ROUTES.items()
+        }
+        self._callback_prefix_routes = {
+            prefix: getattr(self, name) for prefix, name in CALLBACK_PREFIX_ROUTES.items()
+        }
+        self._menu_actions = {
+            label: getattr(self, name) for label, name in MENU_BUTTON_ACTIONS.items()
+        }
+        self._entry_stage_handlers = {
+            stage: getattr(self, name) for stage, name in ENTRY_STAGE_HANDLERS.items()
+        }
+        self._draft_flow_handlers = {
+            kind: getattr(self, name) for kind, name in DRAFT_FLOW_HANDLERS.items()
+        }
+        self._draft_approve_handlers = {
+            key: getattr(self, name) for key, name in DRAFT_APPROVE_HANDLERS.items()
+        }
+        self._inline_handlers = {
+            mode: getattr(self, name) for mode, name in INLINE_MODE_HANDLERS.items()
+        }
+        self._inline_handlers.update(
+            (mode, partial(self._inline_item_picker, spec)) for mode, spec in ITEM_PICKER_SPECS.items()
+        )
+        self._inline_handlers.update(
+            (mode, partial(self._inline_labelled_picker, spec)) for mode, spec in LABELLED_PICKER_SPECS.items()
+        )
+        app.add_handler(CallbackQueryHandler(self.handle_callback_query))
+        app.add_handler(InlineQueryHandler(self.handle_inline_query))
         app.add_handler(CommandHandler("start", self.handle_start))
         app.add_handler(CommandHandler("help", self.handle_help))
         app.add_handler(CommandHandler("items", self.handle_items))
@@ -126,92 +643,21 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                 self.handle_private_message,
             )
         )
-        app.add_handler(InlineQueryHandler(self.handle_inline_query))
-        app.add_handler(CallbackQueryHandler(self.handle_item_callback, pattern=r"^item:"))
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_detail_callback, pattern=r"^entry-detail:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_create_callback, pattern=r"^entry:create$")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_creation_callback, pattern=r"^entrycreate:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_formalize_callback, pattern=r"^formalize:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_purchase_create_callback, pattern=r"^purchase:create$")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_purchase_creation_callback, pattern=r"^purchasecreate:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_purchase_confirm_callback, pattern=rf"^{PURCHASE_CONFIRM_CALLBACK}$")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_purchase_approve_action, pattern=rf"^{PURCHASE_APPROVE_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_purchase_cancel_action, pattern=rf"^{PURCHASE_CANCEL_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_purchase_delete_action, pattern=rf"^{PURCHASE_DELETE_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_purchase_dismiss_action, pattern=rf"^{PURCHASE_DISMISS_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_delivery_create_callback, pattern=r"^delivery:create$")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_delivery_creation_callback, pattern=r"^deliverycreate:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_delivery_confirm_callback, pattern=rf"^{DELIVERY_CONFIRM_CALLBACK}$")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_delivery_approve_action, pattern=rf"^{DELIVERY_APPROVE_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_delivery_cancel_action, pattern=rf"^{DELIVERY_CANCEL_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_delivery_delete_action, pattern=rf"^{DELIVERY_DELETE_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_delivery_dismiss_action, pattern=rf"^{DELIVERY_DISMISS_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_confirm_callback, pattern=r"^entry:confirm$")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_approve_callback, pattern=rf"^{ENTRY_APPROVE_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_cancel_callback, pattern=rf"^{ENTRY_CANCEL_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_delete_callback, pattern=rf"^{ENTRY_DELETE_PREFIX}:")
-        )
-        app.add_handler(
-            CallbackQueryHandler(self.handle_entry_dismiss_callback, pattern=rf"^{ENTRY_DISMISS_PREFIX}:")
-        )
         app.add_error_handler(self.handle_error)
 
     # ------------------------------------------------------ validation helpers
     @staticmethod
     def _validate_token(value: str) -> bool:
-        return bool(re.fullmatch(r"[A-Za-z0-9]{14,18}", value))
+        return 14 <= len(value) <= 18 and TOKEN_RE.fullmatch(value) is not None
 
     @staticmethod
     def _safe_text_preview(value: str, limit: int = 80) -> str:
         trimmed = (value or "").strip()
         if not trimmed:
             return ""
-        if re.fullmatch(r"[A-Za-z0-9]{10,}$", trimmed):
+        if len(trimmed) >= 10 and trimmed.isascii() and trimmed.isalnum():
             return "<token>"
-        single_line = re.sub(r"\s+", " ", trimmed)
+        single_line = WHITESPACE_RE.sub(" ", trimmed)
         if len(single_line) <= limit:
             return single_line
         return single_line[: limit - 1] + "…"
@@ -221,80 +667,40 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         logger.info("event=%s user=%s %s", action, user_id or "-", details.strip())
 
     def _items_markup(self) -> InlineKeyboardMarkup:
-        label = "📦 Buyumlarni ko'rish"
-        button = InlineKeyboardButton(label, switch_inline_query_current_chat="items")
-        return InlineKeyboardMarkup([[button]])
+        return ITEMS_MARKUP
 
     def _main_menu_markup(self) -> ReplyKeyboardMarkup:
-        return ReplyKeyboardMarkup(
-            [
-                ["📦 Buyumlar", "📋 Harakatlar"],
-                ["📝 Rasmiylashtirish"],
-            ],
-            resize_keyboard=True,
-            one_time_keyboard=False,
-        )
+        return MAIN_MENU_MARKUP
 
     def _formalization_options_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup(
-            [
-                [
-                    InlineKeyboardButton(
-                        "📥 Kirgan mahsulotni rasmiylashtirish",
-                        callback_data=FORMALIZE_INCOMING_CALLBACK,
-                    )
-                ],
-                [
-                    InlineKeyboardButton(
-                        "📤 Chiqqan mahsulotni rasmiylashtirish",
-                        callback_data=FORMALIZE_OUTGOING_CALLBACK,
-                    )
-                ],
-            ]
-        )
-
-    @staticmethod
-    def _inline_start_button(text: str) -> InlineQueryResultsButton:
-        label = (text or "Botni ochish").strip() or "Botni ochish"
-        return InlineQueryResultsButton(text=label[:48], start_parameter="start")
+        return FORMALIZATION_OPTIONS_MARKUP
 
     def _entry_markup(self) -> InlineKeyboardMarkup:
-        create_button = InlineKeyboardButton(
-            "➕ Yangi harakat yaratish", callback_data=ENTRY_CALLBACK_CREATE
-        )
-        confirm_button = InlineKeyboardButton(
-            "✔️ Harakatni tasdiqlash", callback_data="entry:confirm"
-        )
-        return InlineKeyboardMarkup([[create_button], [confirm_button]])
+        return ENTRY_MARKUP
 
     def _cancel_creation_button(self, prefix: str = ENTRY_CREATE_PREFIX) -> InlineKeyboardButton:
-        return InlineKeyboardButton(
-            "❌ Jarayonni bekor qilish", callback_data=f"{prefix}:cancel"
-        )
+        return _cancel_creation_button(prefix)
 
     def _cancel_creation_markup(self, prefix: str = ENTRY_CREATE_PREFIX) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup([[self._cancel_creation_button(prefix=prefix)]])
+        return _cancel_creation_markup(prefix)
+
+    _auth_headers = staticmethod(_auth_headers)
+    _erp_error_detail = staticmethod(_erp_error_detail)
+    _json_auth_headers = staticmethod(_json_auth_headers)
 
     @staticmethod
     def _clean_text(value: Optional[str]) -> str:
         if not value:
             return ""
-        return re.sub(r"<[^>]+>", " ", value).strip()
+        return _strip_html(value)
 
-    @staticmethod
-    def _docstatus_label(value: Optional[int]) -> str:
-        mapping = {0: "Draft", 1: "Tasdiqlangan", 2: "Bekor qilingan"}
-        return mapping.get(value, "Noma'lum")
+    _docstatus_label = staticmethod(_docstatus_text)
 
     @staticmethod
     def _entry_type_display(value: Optional[str]) -> str:
-        mapping = {
-            "Material Receipt": "Kirim",
-            "Material Issue": "Chiqim",
-        }
         if not value:
             return "-"
-        return mapping.get(value, value)
+        return ENTRY_TYPE_LABELS.get(value, value)
 
     @staticmethod
     def _transliterate_cyrillic(value: str) -> str:
@@ -379,55 +785,31 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
 
     @staticmethod
     def _parse_warehouse_inline(text: str) -> Optional[Dict[str, str]]:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines:
-            return None
-        if not any("warehouse" in line.lower() for line in lines):
-            return None
-        code = None
-        label = None
-        for line in lines:
-            lowered = line.lower()
-            if lowered.startswith("warehouse:"):
-                label = line.split(":", 1)[1].strip()
-            if lowered.startswith("entry warehouse:"):
-                label = line.split(":", 1)[1].strip()
-            if lowered.startswith("code:"):
-                code = line.split(":", 1)[1].strip()
-        if not code:
-            code = label
-        if not code:
-            return None
-        return {"code": code, "label": label or code}
+        return parse_labelled_inline(text, ("warehouse",), WAREHOUSE_FIELDS)
 
 
     @staticmethod
     def _build_item_keyboard(rows: list[Dict[str, Any]]) -> InlineKeyboardMarkup:
-        buttons: list[list[InlineKeyboardButton]] = []
-        for row in rows[:10]:
-            docname = row.get("item_code") or row.get("name")
-            if not docname:
-                continue
-            label = row.get("item_name") or docname
-            buttons.append([InlineKeyboardButton(label[:60], callback_data=f"item:{docname}")])
-        if not buttons:
-            buttons = [[InlineKeyboardButton("Yangilash", callback_data="item:refresh")]]
-        return InlineKeyboardMarkup(buttons)
+        buttons = [
+            [InlineKeyboardButton((row.get("item_name") or docname)[:60], callback_data=f"item:{docname}")]
+            for row in rows[:10]
+            if (docname := row.get("item_code") or row.get("name"))
+        ]
+        return InlineKeyboardMarkup(buttons) if buttons else EMPTY_ITEM_KEYBOARD
 
-    @staticmethod
-    def _build_entry_keyboard(rows: list[Dict[str, Any]]) -> InlineKeyboardMarkup:
-        buttons: list[list[InlineKeyboardButton]] = []
-        for row in rows[:10]:
-            docname = row.get("name")
-            if not docname:
-                continue
-            purpose_raw = row.get("purpose") or row.get("stock_entry_type")
-            purpose = self._entry_type_display(purpose_raw)
-            label = f"{docname} ({purpose})"
-            buttons.append([InlineKeyboardButton(label[:60], callback_data=f"entry-detail:{docname}")])
-        if not buttons:
-            buttons = [[InlineKeyboardButton("Yangilash", callback_data="entry-detail:refresh")]]
-        return InlineKeyboardMarkup(buttons)
+    @classmethod
+    def _build_entry_keyboard(cls, rows: list[Dict[str, Any]]) -> InlineKeyboardMarkup:
+        buttons = [
+            [
+                InlineKeyboardButton(
+                    f"{docname} ({cls._entry_type_display(row.get('purpose') or row.get('stock_entry_type'))})"[:60],
+                    callback_data=f"entry-detail:{docname}",
+                )
+            ]
+            for row in rows[:10]
+            if (docname := row.get("name"))
+        ]
+        return InlineKeyboardMarkup(buttons) if buttons else EMPTY_ENTRY_KEYBOARD
 
     async def _send_item_preview(
         self,
@@ -437,7 +819,9 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
-        success, error_detail, rows = await self._fetch_items(api_key, api_secret, query="")
+        success, error_detail, rows = await self._fetch_items(
+            api_key, api_secret, query="", limit=1, fields=ITEM_PICKER_FIELDS
+        )
         if not success:
             text = "Buyumlar ro'yxatini olishda xatolik yuz berdi."
             if error_detail:
@@ -472,37 +856,38 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         context: ContextTypes.DEFAULT_TYPE,
         show_message: bool = True,
     ) -> None:
+        if not show_message:
+            return
         success, error_detail, rows = await self._fetch_stock_entries(
             api_key,
             api_secret,
             query="",
         )
         if not success:
-            if show_message:
-                text = "Stock Entry ro'yxatini olishda xatolik yuz berdi."
-                if error_detail:
-                    text += f"\nMa'lumot: {error_detail}"
-                await context.bot.send_message(chat_id=chat_id, text=text)
+            text = "Stock Entry ro'yxatini olishda xatolik yuz berdi."
+            if error_detail:
+                text += f"\nMa'lumot: {error_detail}"
+            await context.bot.send_message(chat_id=chat_id, text=text)
             return
         if not rows:
-            if show_message:
-                await context.bot.send_message(chat_id=chat_id, text="Hozircha Stock Entry topilmadi.")
-            return
-        if not show_message:
+            await context.bot.send_message(chat_id=chat_id, text="Hozircha Stock Entry topilmadi.")
             return
         preview = rows[:5]
-        lines = []
-        for row in preview:
-            name = row.get("name") or "-"
-            purpose_raw = row.get("purpose") or row.get("stock_entry_type")
-            purpose = self._entry_type_display(purpose_raw)
-            posting = row.get("posting_date") or "-"
-            warehouses = f"{row.get('from_warehouse') or '-'} → {row.get('to_warehouse') or '-'}"
-            status = self._docstatus_label(row.get("docstatus"))
-            lines.append(f"• {name} — {purpose} ({posting}, {warehouses}) — {status}")
+        text = "\n".join(
+            ENTRY_PREVIEW_TEMPLATE
+            % (
+                row.get("name") or "-",
+                self._entry_type_display(row.get("purpose") or row.get("stock_entry_type")),
+                row.get("posting_date") or "-",
+                row.get("from_warehouse") or "-",
+                row.get("to_warehouse") or "-",
+                self._docstatus_label(row.get("docstatus")),
+            )
+            for row in preview
+        )
         if len(rows) > len(preview):
-            lines.append(f"... yana {len(rows) - len(preview)} ta harakat inline menyuda mavjud.")
-        await context.bot.send_message(chat_id=chat_id, text="\n".join(lines))
+            text += f"\n... yana {len(rows) - len(preview)} ta harakat inline menyuda mavjud."
+        await context.bot.send_message(chat_id=chat_id, text=text)
 
     async def _start_entry_creation(
         self,
@@ -544,11 +929,11 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         buttons = [
             [
                 InlineKeyboardButton(
-                    opt["label"],
-                    callback_data=f"{ENTRY_CREATE_PREFIX}:type:{key}",
+                    option.label,
+                    callback_data=f"{ENTRY_CREATE_PREFIX}:type:{option.key}",
                 )
             ]
-            for key, opt in ENTRY_TYPE_OPTIONS.items()
+            for option in ENTRY_TYPE_OPTIONS
         ]
         buttons.append([self._cancel_creation_button()])
         await context.bot.send_message(
@@ -569,7 +954,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
         draft["stage"] = "await_item_message"
-        self.storage.save_entry_draft(user_id, draft)
+        self.storage.update_entry_draft_stage(user_id, "await_item_message")
         button = InlineKeyboardMarkup(
             [
                 [
@@ -600,7 +985,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
         draft["stage"] = "await_warehouse_message"
-        self.storage.save_entry_draft(user_id, draft)
+        self.storage.update_entry_draft_stage(user_id, "await_warehouse_message")
         role = draft.get("warehouse_role") or "target"
         prompt = "Qaysi omborga kelgan?" if role == "target" else "Qaysi ombordan chiqyapti?"
         button = InlineKeyboardMarkup(
@@ -631,36 +1016,18 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> bool:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines:
+        if not text.strip():
             await message.reply_text(
                 "Inline menyudan buyum tanlab shu chatga yuboring. Xabar tarkibida \"Buyum kodi:\" bo'lishi kerak."
             )
             return True
-        if not any(
-            "item code" in line.lower()
-            or "buyum kodi" in line.lower()
-            or "#entryitem" in line.lower()
-            for line in lines
-        ):
+        item = parse_item_inline(text, ENTRY_ITEM_MARKERS)
+        if not item:
             return False
-        code = None
-        name = None
-        uom = None
-        for line in lines:
-            if line.startswith("📦"):
-                name = line.lstrip("📦").strip()
-            lowered = line.lower()
-            if lowered.startswith("item code:") or lowered.startswith("buyum kodi:"):
-                code = line.split(":", 1)[1].strip()
-            if lowered.startswith("uom:"):
-                uom = line.split(":", 1)[1].strip()
-        if not code:
-            return False
-        draft["item"] = {"code": code, "name": name or code, "uom": uom or "-"}
+        draft["item"] = item
         draft["stage"] = "await_warehouse_message"
         self.storage.save_entry_draft(user_id, draft)
-        await message.reply_text(f"{name or code} tanlandi.")
+        await message.reply_text(f"{item['name']} tanlandi.")
         await self._prompt_entry_warehouse(
             user_id=user_id,
             chat_id=draft.get("chat_id", message.chat_id),
@@ -682,8 +1049,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> bool:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines:
+        if not text.strip():
             await message.reply_text(
                 "Inline menyudan ombor tanlab shu chatga yuboring. Xabar ichida ombor nomi ko'rinishi kerak."
             )
@@ -720,10 +1086,8 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> bool:
-        normalized = text.replace(",", ".")
-        try:
-            qty = float(normalized)
-        except ValueError:
+        qty = parse_number(text)
+        if qty is None:
             await message.reply_text(
                 "Miqdor noto'g'ri. Masalan: 12.5\nJarayonni to'xtatish uchun 'Bekor qilish' tugmasini tanlang.",
                 reply_markup=self._cancel_creation_markup(),
@@ -738,13 +1102,13 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         draft["quantity"] = qty
         draft["stage"] = "submitting"
         self.storage.save_entry_draft(user_id, draft)
-        await message.reply_text("⏳ Stock Entry yaratilmoqda...")
         await self._finalise_entry_creation(
             user_id=user_id,
             draft=draft,
             api_key=api_key,
             api_secret=api_secret,
             context=context,
+            banner=self._spawn(message.reply_text("⏳ Stock Entry yaratilmoqda...")),
         )
         return True
 
@@ -756,6 +1120,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_key: str,
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
+        banner: Optional[asyncio.Task] = None,
     ) -> None:
         item = draft.get("item")
         warehouse = draft.get("warehouse")
@@ -764,6 +1129,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         warehouse_role = draft.get("warehouse_role")
         chat_id = draft.get("chat_id", user_id)
         if not (item and warehouse and qty and entry_type and warehouse_role):
+            await self._settle(banner)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="Jarayon ma'lumotlari yetarli emas. Iltimos, /entry orqali qaytadan boshlang.",
@@ -779,6 +1145,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             item=item,
             quantity=qty,
         )
+        await self._settle(banner)
         if success:
             self.storage.delete_entry_draft(user_id)
             detail_success = False
@@ -790,8 +1157,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                     docname,
                 )
             if detail_success:
-                summary = detail.copy()
-                text_message = self._format_stock_entry_message(summary, detail)
+                text_message = self._format_stock_entry_message(detail, detail)
                 markup = self._entry_action_buttons(detail)
                 await context.bot.send_message(
                     chat_id=chat_id,
@@ -812,7 +1178,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                 )
         else:
             draft["stage"] = "await_qty"
-            self.storage.save_entry_draft(user_id, draft)
+            self.storage.update_entry_draft_stage(user_id, "await_qty")
             message = self._format_entry_error(error_detail)
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -829,9 +1195,8 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         chat_id: int,
         message,
         context: ContextTypes.DEFAULT_TYPE,
-        entry_draft: Optional[Dict[str, Any]] = None,
     ) -> bool:
-        draft = entry_draft or self.storage.get_entry_draft(user_id)
+        draft = self.storage.pop_entry_draft(user_id)
         if not draft:
             self._log_event(user_id, "cancel_draft_missing")
             await message.reply_text("Bekor qiladigan jarayon topilmadi.")
@@ -840,24 +1205,17 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         stage = draft.get("stage")
         self._log_event(user_id, "cancel_draft", kind=draft_kind, stage=stage)
         if draft_kind == "purchase_confirm":
-            self.storage.delete_entry_draft(user_id)
             await message.reply_text("Kirim hujjati tasdiqlash jarayoni bekor qilindi.")
             return True
         if draft_kind == "delivery_confirm":
-            self.storage.delete_entry_draft(user_id)
             await message.reply_text("Chiqqan mahsulot hujjati tasdiqlash jarayoni bekor qilindi.")
             return True
-        notice = None
+        notice = "Yangi harakat jarayoni bekor qilindi."
         if draft_kind == "purchase_receipt":
             notice = "Kirim hujjati jarayoni bekor qilindi."
         elif draft_kind == "delivery_note":
             notice = "Chiqqan mahsulot hujjati jarayoni bekor qilindi."
-        await self._cancel_entry_creation(
-            user_id=user_id,
-            chat_id=chat_id,
-            context=context,
-            notice=notice,
-        )
+        await context.bot.send_message(chat_id=chat_id, text=notice)
         self._log_event(user_id, "cancel_entry_flow", kind=draft_kind, stage=stage)
         return True
 
@@ -869,13 +1227,12 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                 await update.message.reply_text("Iltimos, men bilan shaxsiy chatda gaplashing: /start")
             return
 
-        self.storage.record_user(
+        creds = self.storage.record_user_and_get_credentials(
             user.id,
             username=user.username,
             first_name=user.first_name,
             last_name=user.last_name,
         )
-        creds = self.storage.get_credentials(user.id)
         status = (creds or {}).get("status") or "pending_key"
         if status == "pending_key":
             text = (
@@ -928,12 +1285,11 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         user = update.effective_user
         if not chat or not user or chat.type != ChatType.PRIVATE or not update.message:
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
+        credentials = self._active_credentials(user.id)
+        if credentials is None:
             await update.message.reply_text("Avval /start orqali API kalit va secret ni tasdiqlang.")
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         await update.message.reply_text(
             "Inline tugmani bosing va buyumlarni ko'ring.",
             reply_markup=self._items_markup(),
@@ -951,25 +1307,17 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         message = update.message
         if not chat or not user or not message or chat.type != ChatType.PRIVATE:
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
+        credentials = self._active_credentials(user.id)
+        if credentials is None:
             await message.reply_text("Avval /start orqali API kalit va secret ni tasdiqlang.")
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         await self._send_item_preview(
             chat_id=chat.id,
             api_key=api_key,
             api_secret=api_secret,
             context=context,
         )
-        await self._send_entry_preview(
-            chat_id=chat.id,
-            api_key=api_key,
-            api_secret=api_secret,
-            context=context,
-            show_message=False,
-        )
         await message.reply_text(
             "Stock Entry menyusi:\nYangi harakat yaratish yoki tasdiqlash uchun variantni tanlang.",
             reply_markup=self._entry_markup(),
@@ -990,14 +1338,13 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         chat = message.chat if message else None
         if not chat or not user or chat.type != ChatType.PRIVATE:
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
+        credentials = self._active_credentials(user.id)
+        if credentials is None:
             await context.bot.send_message(
                 chat_id=chat.id, text="Avval /start orqali API kalit va secret ni tasdiqlang."
             )
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         if data == FORMALIZE_INCOMING_CALLBACK:
             await self._send_purchase_preview(
                 chat_id=chat.id,
@@ -1062,6 +1409,50 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             context=context,
         )
 
+    @staticmethod
+    def _credential_pair(creds: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        if not creds:
+            return "", ""
+        return creds.get("api_key") or "", creds.get("api_secret") or ""
+
+    def _active_credentials(self, user_id: int) -> Optional[Tuple[str, str]]:
+        creds = self.storage.get_credentials(user_id)
+        if not creds or creds.get("status") != "active":
+            return None
+        return self._credential_pair(creds)
+
+    def _refresh_throttled(self, user_id: int, kind: str) -> bool:
+        now = time.monotonic()
+        key = (user_id, kind)
+        last = self._last_refresh.get(key)
+        if last is not None and now - last < REFRESH_COOLDOWN:
+            return True
+        if len(self._last_refresh) >= REFRESH_TRACK_LIMIT:
+            self._last_refresh = {
+                seen: stamp for seen, stamp in self._last_refresh.items() if now - stamp < REFRESH_COOLDOWN
+            }
+        self._last_refresh[key] = now
+        return False
+
+    async def _active_callback_credentials(self, query, user_id: int) -> Optional[Tuple[str, str]]:
+        credentials = self._active_credentials(user_id)
+        if credentials is None:
+            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        return credentials
+
+    async def handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        if not query:
+            return
+        data = query.data or ""
+        handler = self._callback_exact_routes.get(data)
+        if handler is None:
+            prefix, _, _ = data.partition(":")
+            handler = self._callback_prefix_routes.get(prefix)
+        if handler is None:
+            return
+        await handler(update, context)
+
     async def handle_item_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         query = update.callback_query
         if not query:
@@ -1070,15 +1461,15 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        payload = (query.data or "").split(":", 1)
-        action = payload[1] if len(payload) == 2 else ""
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        action = (query.data or "").partition(":")[2]
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         if action in {"", "refresh"}:
+            if self._refresh_throttled(user.id, "item"):
+                await query.answer("Yangilandi", show_alert=False)
+                return
             await query.answer("Yangilanmoqda…", show_alert=False)
             await self._send_item_preview(
                 chat_id=query.message.chat_id if query.message else user.id,
@@ -1087,7 +1478,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                 context=context,
             )
             return
-        success, error, detail = await self._fetch_item_detail(api_key, api_secret, action)
+        success, error, detail = await self._detail_task(self._fetch_item_detail, api_key, api_secret, action)
         if not success:
             await query.answer(error or "Buyum ma'lumotini olishda xatolik.", show_alert=True)
             return
@@ -1108,15 +1499,15 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        payload = (query.data or "").split(":", 1)
-        docname = payload[1] if len(payload) == 2 else ""
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        docname = (query.data or "").partition(":")[2]
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         if docname in {"", "refresh"}:
+            if self._refresh_throttled(user.id, "entry"):
+                await query.answer("Yangilandi", show_alert=False)
+                return
             await query.answer("Yangilanmoqda…", show_alert=False)
             await self._send_entry_preview(
                 chat_id=query.message.chat_id if query.message else user.id,
@@ -1126,7 +1517,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                 show_message=True,
             )
             return
-        success, error, detail = await self._fetch_stock_entry_detail(api_key, api_secret, docname)
+        success, error, detail = await self._detail_task(self._fetch_stock_entry_detail, api_key, api_secret, docname)
         if not success:
             await query.answer(error or "Stock Entry ma'lumotini olishda xatolik.", show_alert=True)
             return
@@ -1149,12 +1540,10 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key")
-        api_secret = creds.get("api_secret")
+        api_key, api_secret = credentials
         if not api_key or not api_secret:
             await query.answer("API kalitlari topilmadi.", show_alert=True)
             return
@@ -1174,20 +1563,16 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        parts = (query.data or "").split(":", 2)
-        action = parts[1] if len(parts) > 1 else ""
-        value = parts[2] if len(parts) > 2 else ""
+        action, _, value = (query.data or "").partition(":")[2].partition(":")
         draft = self.storage.get_entry_draft(user.id)
         if not draft:
             await query.answer("Jarayon topilmadi. /entry orqali qayta boshlang.", show_alert=True)
             return
         chat_id = draft.get("chat_id") or (query.message.chat_id if query.message else user.id)
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
 
         if action == "cancel":
             await query.answer("Jarayon bekor qilindi.", show_alert=False)
@@ -1199,18 +1584,18 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             return
 
         if action == "type":
-            option = ENTRY_TYPE_OPTIONS.get(value)
+            option = ENTRY_TYPE_BY_KEY.get(value)
             if not option:
                 await query.answer("Noto'g'ri tur tanlandi.", show_alert=True)
                 return
-            draft["entry_type"] = option["value"]
-            draft["entry_type_label"] = option["label"]
-            draft["warehouse_role"] = option["warehouse_role"]
+            draft["entry_type"] = option.value
+            draft["entry_type_label"] = option.label
+            draft["warehouse_role"] = option.warehouse_role
             draft["stage"] = "await_item_message"
             draft.pop("item", None)
             draft.pop("warehouse", None)
             self.storage.save_entry_draft(user.id, draft)
-            await query.answer(f"{option['label']} tanlandi.", show_alert=False)
+            await query.answer(f"{option.label} tanlandi.", show_alert=False)
             await self._prompt_entry_item(
                 user_id=user.id,
                 chat_id=chat_id,
@@ -1233,12 +1618,10 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         draft = {
             "kind": "stock_entry",
             "stage": "await_approve",
@@ -1249,16 +1632,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         await context.bot.send_message(
             chat_id=draft["chat_id"],
             text="Tasdiqlash uchun quyidagi oynani ochib qidiruvdan foydalaning.",
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [
-                        InlineKeyboardButton(
-                            "📋 Tasdiqlash oynasini ochish",
-                            switch_inline_query_current_chat="entryapprove",
-                        )
-                    ]
-                ]
-            ),
+            reply_markup=ENTRY_APPROVE_INLINE_MARKUP,
         )
 
     async def handle_entry_approve_callback(
@@ -1271,18 +1645,17 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Harakat aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._submit_stock_entry(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -1309,18 +1682,17 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Harakat aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._cancel_stock_entry(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -1349,18 +1721,17 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)
-        docname = docname[1] if len(docname) == 2 else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Harakat aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._delete_stock_entry(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -1389,8 +1760,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        parts = (query.data or "").split(":", 1)
-        docname = parts[1] if len(parts) == 2 else ""
+        docname = (query.data or "").partition(":")[2]
         await query.answer("Saqlab qo'yildi.", show_alert=False)
         if query.message:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -1415,15 +1785,19 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         from_inline_result = bool(message.via_bot and context.bot and message.via_bot.id == context.bot.id)
         normalized = text.lower()
 
-        self.storage.record_user(
-            user.id,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name,
-        )
-        creds = self.storage.get_credentials(user.id)
+        if from_inline_result:
+            entry_draft = self.storage.get_entry_draft(user.id)
+            if not entry_draft:
+                return
+            creds = self.storage.get_credentials(user.id)
+        else:
+            creds, entry_draft = self.storage.record_user_and_get_state(
+                user.id,
+                username=user.username,
+                first_name=user.first_name,
+                last_name=user.last_name,
+            )
         status = (creds or {}).get("status") or "pending_key"
-        entry_draft = self.storage.get_entry_draft(user.id)
         stage_label = entry_draft.get("stage") if entry_draft else "-"
         preview = self._safe_text_preview(text)
         self._log_event(
@@ -1434,8 +1808,6 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             inline=int(from_inline_result),
             text=preview,
         )
-        if from_inline_result and not entry_draft:
-            return
         if entry_draft:
             draft_kind = entry_draft.get("kind") or "stock_entry"
             entry_draft["kind"] = draft_kind
@@ -1445,71 +1817,13 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                     chat_id=message.chat_id,
                     message=message,
                     context=context,
-                    entry_draft=entry_draft,
                 )
                 return
             stage = entry_draft.get("stage")
-            api_key = (creds or {}).get("api_key") or ""
-            api_secret = (creds or {}).get("api_secret") or ""
-            if draft_kind == "purchase_confirm":
-                if stage == "await_purchase_confirm":
-                    handled = await self._handle_purchase_approve_message(
-                        user_id=user.id,
-                        message=message,
-                        text=text,
-                        api_key=api_key,
-                        api_secret=api_secret,
-                        context=context,
-                    )
-                    if handled:
-                        return
-                if from_inline_result:
-                    return
-                await message.reply_text(
-                    (
-                        "Kirim hujjatini tasdiqlash jarayoni davom etmoqda.\n"
-                        "Inline menyudan #purchaseapprove natijasini yuboring yoki /cancel deb yozib bekor qiling."
-                    )
-                )
-                return
-            if draft_kind == "delivery_confirm":
-                if stage == "await_delivery_confirm":
-                    handled = await self._handle_delivery_approve_message(
-                        user_id=user.id,
-                        message=message,
-                        text=text,
-                        api_key=api_key,
-                        api_secret=api_secret,
-                        context=context,
-                    )
-                    if handled:
-                        return
-                if from_inline_result:
-                    return
-                await message.reply_text(
-                    (
-                        "Chiqqan mahsulot hujjatini tasdiqlash jarayoni davom etmoqda.\n"
-                        "Inline menyundan #deliveryapprove natijasini yuboring yoki /cancel deb yozib bekor qiling."
-                    )
-                )
-                return
-            if draft_kind == "purchase_receipt":
-                handled = await self._handle_purchase_receipt_message(
-                    user_id=user.id,
-                    message=message,
-                    text=text,
-                    draft=entry_draft,
-                    api_key=api_key,
-                    api_secret=api_secret,
-                    context=context,
-                    from_inline_result=from_inline_result,
-                )
-                if handled or from_inline_result:
-                    return
-                # purchase receipt jarayoni uchun boshqa ishlov yo'q
-                return
-            if draft_kind == "delivery_note":
-                handled = await self._handle_delivery_note_message(
+            api_key, api_secret = self._credential_pair(creds)
+            flow_handler = self._draft_flow_handlers.get(draft_kind)
+            if flow_handler:
+                await flow_handler(
                     user_id=user.id,
                     message=message,
                     text=text,
@@ -1519,40 +1833,24 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                     context=context,
                     from_inline_result=from_inline_result,
                 )
-                if handled or from_inline_result:
-                    return
-                return
-            if stage in {"await_item_message", "await_warehouse_message", "await_qty"} and (
-                not api_key or not api_secret or status != "active"
-            ):
-                await message.reply_text("Avval API kalit va secretni kiriting.")
                 return
-            if stage == "await_item_message":
-                handled = await self._handle_entry_item_message(
+            approve_handler = self._draft_approve_handlers.get((draft_kind, stage))
+            if approve_handler:
+                handled = await approve_handler(
                     user_id=user.id,
                     message=message,
                     text=text,
-                    draft=entry_draft,
                     api_key=api_key,
                     api_secret=api_secret,
                     context=context,
                 )
                 if handled:
                     return
-            if stage == "await_warehouse_message":
-                handled = await self._handle_entry_warehouse_message(
-                    user_id=user.id,
-                    message=message,
-                    text=text,
-                    draft=entry_draft,
-                    api_key=api_key,
-                    api_secret=api_secret,
-                    context=context,
-                )
-                if handled:
+            elif entry_handler := self._entry_stage_handlers.get(stage):
+                if not api_key or not api_secret or status != "active":
+                    await message.reply_text("Avval API kalit va secretni kiriting.")
                     return
-            if stage == "await_qty":
-                handled = await self._handle_entry_quantity_message(
+                handled = await entry_handler(
                     user_id=user.id,
                     message=message,
                     text=text,
@@ -1563,101 +1861,19 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                 )
                 if handled:
                     return
-            if stage == "await_approve":
-                handled = await self._handle_entry_approve_message(
-                    user_id=user.id,
-                    message=message,
-                    text=text,
-                    api_key=api_key,
-                    api_secret=api_secret,
-                    context=context,
-                )
-                if handled:
-                    return
             if from_inline_result:
                 return
-
-        normalized = text.lower()
-        item_texts = {"📦 Buyumlar", "📦 Buyumlarni ko'rish", "📦 Itemlar", "📦 Itemlarni ko'rish"}
-        if text in item_texts:
-            if status != "active":
-                await message.reply_text("Avval API kalit va secretni kiriting.")
-                return
-            api_key = creds.get("api_key") or ""
-            api_secret = creds.get("api_secret") or ""
-            await self._send_item_preview(
-                chat_id=message.chat_id,
-                api_key=api_key,
-                api_secret=api_secret,
-                context=context,
-            )
-            return
-        if normalized in {"📋 harakatlar", "harakatlar"} or text in {"📋 Harakatlar"}:
-            if status != "active":
-                await message.reply_text("Avval API kalit va secretni kiriting.")
-                return
-            await message.reply_text(
-                "Stock Entry menyusi:",
-                reply_markup=self._entry_markup(),
-            )
-            api_key = creds.get("api_key") or ""
-            api_secret = creds.get("api_secret") or ""
-            await self._send_entry_preview(
-                chat_id=message.chat_id,
-                api_key=api_key,
-                api_secret=api_secret,
-                context=context,
-                show_message=False,
-            )
-            return
-        if text in {"📝 Rasmiylashtirish"} or normalized in {"rasmiylashtirish"}:
-            if status != "active":
-                await message.reply_text("Avval API kalit va secretni kiriting.")
-                return
-            await message.reply_text(
-                "Mahsulotni rasmiylashtirish turini tanlang:",
-                reply_markup=self._formalization_options_markup(),
-            )
-            return
-        purchase_texts = {"🧾 Kirim hujjati", "📥 Kirgan mahsulotni rasmiylashtirish"}
-        purchase_normalized = {"kirim hujjati", "kirim", "kirgan mahsulotni rasmiylashtirish"}
-        if text in purchase_texts or normalized in purchase_normalized:
-            if status != "active":
-                await message.reply_text("Avval API kalit va secretni kiriting.")
+            pending_hint = DRAFT_PENDING_HINTS.get(draft_kind)
+            if pending_hint:
+                await message.reply_text(pending_hint)
                 return
-            api_key = creds.get("api_key") or ""
-            api_secret = creds.get("api_secret") or ""
-            await self._send_purchase_preview(
-                chat_id=message.chat_id,
-                api_key=api_key,
-                api_secret=api_secret,
-                context=context,
-                show_preview=False,
-            )
-            await message.reply_text(
-                "Kirgan mahsulotlarni rasmiylashtirish menyusi:",
-                reply_markup=self._purchase_markup(),
-            )
-            return
-        delivery_texts = {"🚚 Chiqqan mahsulot hujjati", "📤 Chiqqan mahsulotni rasmiylashtirish"}
-        delivery_normalized = {"chiqqan mahsulot hujjati", "chiqim", "chiqqan mahsulotni rasmiylashtirish"}
-        if text in delivery_texts or normalized in delivery_normalized:
+
+        menu_action = self._menu_actions.get(text) or self._menu_actions.get(normalized)
+        if menu_action:
             if status != "active":
                 await message.reply_text("Avval API kalit va secretni kiriting.")
                 return
-            api_key = creds.get("api_key") or ""
-            api_secret = creds.get("api_secret") or ""
-            await self._send_delivery_preview(
-                chat_id=message.chat_id,
-                api_key=api_key,
-                api_secret=api_secret,
-                context=context,
-                show_message=False,
-            )
-            await message.reply_text(
-                "Chiqqan mahsulotlarni rasmiylashtirish menyusi:",
-                reply_markup=self._delivery_markup(),
-            )
+            await menu_action(message=message, creds=creds, context=context)
             return
         if status == "pending_key" or not (creds and creds.get("api_key")):
             if not self._validate_token(text):
@@ -1701,6 +1917,121 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             reply_markup=self._items_markup(),
         )
 
+    async def _open_items_menu(
+        self, *, message, creds: Dict[str, Any], context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        api_key, api_secret = self._credential_pair(creds)
+        await self._send_item_preview(
+            chat_id=message.chat_id,
+            api_key=api_key,
+            api_secret=api_secret,
+            context=context,
+        )
+
+    async def _open_entries_menu(
+        self, *, message, creds: Dict[str, Any], context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        await message.reply_text("Stock Entry menyusi:", reply_markup=self._entry_markup())
+
+    async def _open_formalization_menu(
+        self, *, message, creds: Dict[str, Any], context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        await message.reply_text(
+            "Mahsulotni rasmiylashtirish turini tanlang:",
+            reply_markup=self._formalization_options_markup(),
+        )
+
+    async def _open_purchase_menu(
+        self, *, message, creds: Dict[str, Any], context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        await message.reply_text(
+            "Kirgan mahsulotlarni rasmiylashtirish menyusi:",
+            reply_markup=self._purchase_markup(),
+        )
+
+    async def _open_delivery_menu(
+        self, *, message, creds: Dict[str, Any], context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        await message.reply_text(
+            "Chiqqan mahsulotlarni rasmiylashtirish menyusi:",
+            reply_markup=self._delivery_markup(),
+        )
+
+    async def _reference_rows(
+        self,
+        fetch: Callable[..., Awaitable[Tuple[bool, Optional[str], List[Dict[str, Any]]]]],
+        api_key: str,
+        api_secret: str,
+        ttl: float = LIST_CACHE_TTL,
+        **params: Any,
+    ) -> Tuple[bool, Optional[str], List[Dict[str, Any]]]:
+        cache = self._list_cache
+        key = (fetch.__name__, api_key, *sorted(params.items()))
+        hit = cache.get(key)
+        if hit and time.monotonic() - hit[0] < ttl:
+            return True, None, hit[1]
+        inflight = self._list_inflight
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch(api_key, api_secret, **params))
+            inflight[key] = task
+            task.add_done_callback(lambda _task: inflight.pop(key, None))
+        success, error_detail, rows = await asyncio.shield(task)
+        if success:
+            cache[key] = (time.monotonic(), rows)
+            cache.move_to_end(key)
+            if len(cache) > LIST_CACHE_SIZE:
+                cache.popitem(last=False)
+        return success, error_detail, rows
+
+    async def _answer_inline_error(
+        self, inline_query: InlineQuery, error_detail: Optional[str], fallback: str
+    ) -> None:
+        await inline_query.answer(
+            (),
+            is_personal=True,
+            cache_time=3,
+            button=_inline_start_button(error_detail or fallback),
+        )
+
+    def _item_picker_results(
+        self, rows: List[Dict[str, Any]], spec: ItemPickerSpec
+    ) -> List[InlineQueryResultArticle]:
+        results = []
+        for idx, row in enumerate(rows[: self.config.item_limit]):
+            item_name = row.get("item_name") or row.get("name") or row.get("item_code") or "Buyum"
+            item_code = row.get("item_code") or row.get("name") or "-"
+            uom = row.get("stock_uom") or "-"
+            text = ITEM_PICKER_TEMPLATE % (spec.tag, item_name, item_code, uom)
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"{spec.id_prefix}-{idx}",
+                    title=f"{item_name} ({item_code})",
+                    description=f"UOM: {uom}",
+                    input_message_content=InputTextMessageContent(text),
+                )
+            )
+        return results
+
+    @staticmethod
+    def _labelled_picker_results(
+        rows: List[Dict[str, Any]], spec: LabelledPickerSpec
+    ) -> List[InlineQueryResultArticle]:
+        results = []
+        for idx, row in enumerate(rows):
+            name = row.get("name") or "-"
+            label = next((row[field] for field in spec.label_fields if row.get(field)), name)
+            text = LABELLED_PICKER_TEMPLATE % (spec.tag, spec.label_caption, label, spec.code_caption, name)
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"{spec.id_prefix}-{idx}",
+                    title=label,
+                    description=name,
+                    input_message_content=InputTextMessageContent(text),
+                )
+            )
+        return results
+
     async def handle_inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         inline_query = update.inline_query
         if not inline_query:
@@ -1710,603 +2041,284 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             await inline_query.answer([], cache_time=5, is_personal=True)
             return
 
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
+        credentials = self._active_credentials(user.id)
+        if credentials is None:
             await inline_query.answer(
                 [],
                 is_personal=True,
                 cache_time=3,
-                button=self._inline_start_button("Avval /start ni bosing"),
+                button=START_REQUIRED_BUTTON,
             )
             return
 
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         query_text = (inline_query.query or "").strip()
-        trimmed_query = query_text.lstrip()
-        lower_query = trimmed_query.lower()
-        entry_item_mode = lower_query.startswith("entryitem") or lower_query.startswith("itemlookup")
-        entry_wh_mode = lower_query.startswith("entrywarehouse") or lower_query.startswith("warehouse")
-        entry_approve_mode = any(lower_query.startswith(prefix) for prefix in ENTRY_APPROVE_QUERY_PREFIXES)
-        purchase_approve_mode = any(lower_query.startswith(prefix) for prefix in PURCHASE_APPROVE_QUERY_PREFIXES)
-        purchase_mode = lower_query.startswith(PURCHASE_TRIGGER) and not purchase_approve_mode
-        purchase_item_mode = lower_query.startswith(PURCHASE_ITEM_QUERY_PREFIX)
-        supplier_mode = lower_query.startswith(PURCHASE_SUPPLIER_QUERY_PREFIX)
-        delivery_approve_mode = any(lower_query.startswith(prefix) for prefix in DELIVERY_APPROVE_QUERY_PREFIXES)
-        delivery_mode = lower_query.startswith(DELIVERY_TRIGGER) and not delivery_approve_mode
-        delivery_item_mode = lower_query.startswith(DELIVERY_ITEM_QUERY_PREFIX)
-        customer_mode = lower_query.startswith(DELIVERY_CUSTOMER_QUERY_PREFIX)
-        entry_mode = lower_query.startswith(ENTRY_TRIGGER) and not (
-            entry_item_mode or entry_wh_mode or entry_approve_mode
-        )
+        lower_query = query_text.lower()
+        mode, active_prefix = match_inline_prefix(lower_query)
+        if mode is None:
+            search_term = "" if lower_query in ITEM_LIST_QUERIES else query_text
+        else:
+            search_term = query_text[len(active_prefix):].strip()
         logger.info(
             "Inline query from %s (%s): %r",
             user.id,
-            "entry" if entry_mode else "item",
+            mode or "item",
             inline_query.query,
         )
 
-        if entry_mode:
-            search_term = trimmed_query[len(ENTRY_TRIGGER):].strip()
-            success, error_detail, rows = await self._fetch_stock_entries(
-                api_key,
-                api_secret,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Stock Entry ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
+        handler = self._inline_handlers.get(mode, self._inline_items)
+        await handler(inline_query, search_term, api_key, api_secret)
 
-            results = []
-            for idx, row in enumerate(rows):
-                docname = row.get("name")
-                if not docname:
-                    continue
-                detail_success, _, detail = await self._fetch_stock_entry_detail(
-                    api_key, api_secret, docname
-                )
-                message_text = self._format_stock_entry_message(row, detail if detail_success else None)
-                entry_label = self._entry_type_display(row.get("purpose") or row.get("stock_entry_type"))
-                title = f"{docname} ({entry_label})"
-                warehouses = f"{row.get('from_warehouse') or '-'} → {row.get('to_warehouse') or '-'}"
-                posting = row.get("posting_date") or "-"
-                description = f"{posting} • {warehouses}"
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"entry-{idx}",
-                        title=title,
-                        description=description,
-                        input_message_content=InputTextMessageContent(message_text),
-                    )
+    async def _inline_entries(
+        self, inline_query: InlineQuery, search_term: str, api_key: str, api_secret: str
+    ) -> None:
+        success, error_detail, rows = await self._fetch_stock_entries(
+            api_key,
+            api_secret,
+            query=search_term,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, "Stock Entry ro'yxatini olishda xatolik")
+            return
+
+        rows = [row for row in rows if row.get("name")][: min(self.config.item_limit, 10)]
+        details = self._start_detail_fetches(self._fetch_stock_entry_detail, api_key, api_secret, rows)
+        results = []
+        for idx, (row, pending) in enumerate(zip(rows, details)):
+            detail_success, _, detail = await pending
+            docname = row["name"]
+            message_text = self._format_stock_entry_message(row, detail if detail_success else None)
+            entry_label = self._entry_type_display(row.get("purpose") or row.get("stock_entry_type"))
+            title = f"{docname} ({entry_label})"
+            warehouses = f"{row.get('from_warehouse') or '-'} → {row.get('to_warehouse') or '-'}"
+            posting = row.get("posting_date") or "-"
+            description = f"{posting} • {warehouses}"
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"entry-{idx}",
+                    title=title,
+                    description=description,
+                    input_message_content=InputTextMessageContent(message_text),
                 )
-                if len(results) >= min(self.config.item_limit, 10):
-                    break
+            )
+
+        await inline_query.answer(results, cache_time=0, is_personal=True)
 
-            await inline_query.answer(results, cache_time=0, is_personal=True)
+    async def _inline_entry_approvals(
+        self, inline_query: InlineQuery, search_term: str, api_key: str, api_secret: str
+    ) -> None:
+        success, error_detail, rows = await self._fetch_stock_entries(
+            api_key,
+            api_secret,
+            query=search_term,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, "Stock Entry ro'yxatini olishda xatolik")
             return
-        elif entry_item_mode:
-            prefix = "entryitem" if lower_query.startswith("entryitem") else "itemlookup"
-            search_term = trimmed_query[len(prefix):].strip()
-            success, error_detail, rows = await self._fetch_items(
-                api_key,
-                api_secret,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Buyumlar ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            for idx, row in enumerate(rows):
-                item_name = row.get("item_name") or row.get("name") or row.get("item_code") or "Buyum"
-                item_code = row.get("item_code") or row.get("name") or "-"
-                uom = row.get("stock_uom") or "-"
-                text = "\n".join(
-                    [
-                        "#entryitem",
-                        f"📦 {item_name}",
-                        f"Buyum kodi: {item_code}",
-                        f"UOM: {uom}",
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"entryitem-{idx}",
-                        title=f"{item_name} ({item_code})",
-                        description=f"UOM: {uom}",
-                        input_message_content=InputTextMessageContent(text),
-                    )
+        rows = [row for row in rows if row.get("name")][: min(self.config.item_limit, 10)]
+        results = []
+        for idx, row in enumerate(rows):
+            docname = row["name"]
+            status = self._docstatus_label(row.get("docstatus"))
+            entry_type = self._entry_type_display(row.get("purpose") or row.get("stock_entry_type"))
+            short_name = docname[-5:] if len(docname) > 5 else docname
+            title = f"{short_name} ({entry_type})"
+            description = f"{row.get('posting_date') or '-'} • {status}"
+            text = ENTRY_APPROVE_RESULT_TEMPLATE % (docname, entry_type, status, docname)
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"entryapprove-{idx}",
+                    title=title,
+                    description=description,
+                    input_message_content=InputTextMessageContent(text),
                 )
-                if len(results) >= self.config.item_limit:
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
-            return
-
-        elif entry_wh_mode:
-            prefix = "entrywarehouse" if lower_query.startswith("entrywarehouse") else "warehouse"
-            search_term = trimmed_query[len(prefix):].strip()
-            success, error_detail, rows = await self._fetch_warehouses(
-                api_key,
-                api_secret,
-                limit=self.config.warehouse_limit,
-                query=search_term,
             )
-            if not success:
-                hint = error_detail or "Ombor ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            lowered_term = search_term.lower()
-            for idx, row in enumerate(rows):
-                name = row.get("name") or "-"
-                label = row.get("warehouse_name") or name
-                if lowered_term and lowered_term not in label.lower() and lowered_term not in name.lower():
-                    continue
-                text = "\n".join(
-                    [
-                        "#entrywarehouse",
-                        f"Warehouse: {label}",
-                        f"Code: {name}",
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"entrywarehouse-{idx}",
-                        title=label,
-                        description=name,
-                        input_message_content=InputTextMessageContent(text),
-                    )
-                )
-                if len(results) >= self.config.warehouse_limit:
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
-            return
+        await inline_query.answer(results, cache_time=0, is_personal=True)
 
-        elif entry_approve_mode:
-            active_prefix = next((prefix for prefix in ENTRY_APPROVE_QUERY_PREFIXES if lower_query.startswith(prefix)), "")
-            search_term = trimmed_query[len(active_prefix):].strip()
-            success, error_detail, rows = await self._fetch_stock_entries(
-                api_key,
-                api_secret,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Stock Entry ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            for idx, row in enumerate(rows):
-                docname = row.get("name")
-                if not docname:
-                    continue
-                status = self._docstatus_label(row.get("docstatus"))
-                entry_type = self._entry_type_display(row.get("purpose") or row.get("stock_entry_type"))
-                short_name = docname[-5:] if len(docname) > 5 else docname
-                title = f"{short_name} ({entry_type})"
-                description = f"{row.get('posting_date') or '-'} • {status}"
-                track_token = f"{ENTRY_APPROVE_PREFIX}:{docname}"
-                text = "\n".join(
-                    [
-                        "#entryapprove",
-                        f"Stock Entry: {docname}",
-                        f"Harakat turi: {entry_type}",
-                        f"Status: {status}",
-                        track_token,
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"entryapprove-{idx}",
-                        title=title,
-                        description=description,
-                        input_message_content=InputTextMessageContent(text),
-                    )
-                )
-                if len(results) >= min(self.config.item_limit, 10):
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
+    async def _inline_purchase_receipts(
+        self, inline_query: InlineQuery, search_term: str, api_key: str, api_secret: str
+    ) -> None:
+        success, error_detail, rows = await self._fetch_purchase_receipts(
+            api_key,
+            api_secret,
+            query=search_term,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, "Kirim hujjatlari ro'yxatini olishda xatolik")
             return
-
-        elif purchase_mode:
-            search_term = trimmed_query[len(PURCHASE_TRIGGER):].strip()
-            success, error_detail, rows = await self._fetch_purchase_receipts(
-                api_key,
-                api_secret,
-                query=search_term,
+        rows = [row for row in rows if row.get("name")][: min(self.config.purchase_receipt_limit, 10)]
+        details = self._start_detail_fetches(self._fetch_purchase_receipt_detail, api_key, api_secret, rows)
+        results = []
+        for idx, (row, pending) in enumerate(zip(rows, details)):
+            detail_success, _, detail = await pending
+            docname = row["name"]
+            message_text = self._format_purchase_receipt_message(
+                row, detail if detail_success else None
             )
-            if not success:
-                hint = error_detail or "Kirim hujjatlari ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            for idx, row in enumerate(rows):
-                docname = row.get("name")
-                if not docname:
-                    continue
-                detail_success, _, detail = await self._fetch_purchase_receipt_detail(
-                    api_key, api_secret, docname
-                )
-                message_text = self._format_purchase_receipt_message(
-                    row, detail if detail_success else None
-                )
-                supplier = row.get("supplier") or "-"
-                posting_date = row.get("posting_date") or "-"
-                posting_time = row.get("posting_time") or "-"
-                description = f"{supplier} • {posting_date} {posting_time}"
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"purchase-{idx}",
-                        title=f"{docname} ({supplier})",
-                        description=description,
-                        input_message_content=InputTextMessageContent(message_text),
-                    )
+            supplier = row.get("supplier") or "-"
+            posting_date = row.get("posting_date") or "-"
+            posting_time = row.get("posting_time") or "-"
+            description = f"{supplier} • {posting_date} {posting_time}"
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"purchase-{idx}",
+                    title=f"{docname} ({supplier})",
+                    description=description,
+                    input_message_content=InputTextMessageContent(message_text),
                 )
-                if len(results) >= min(self.config.purchase_receipt_limit, 10):
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
-            return
-
-        elif purchase_approve_mode:
-            active_prefix = next(
-                (prefix for prefix in PURCHASE_APPROVE_QUERY_PREFIXES if lower_query.startswith(prefix)), ""
-            )
-            search_term = trimmed_query[len(active_prefix):].strip()
-            success, error_detail, rows = await self._fetch_purchase_receipts(
-                api_key,
-                api_secret,
-                query=search_term,
             )
-            if not success:
-                hint = error_detail or "Kirim hujjatlari ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            for idx, row in enumerate(rows):
-                docname = row.get("name")
-                if not docname:
-                    continue
-                status = self._docstatus_label(row.get("docstatus"))
-                supplier = row.get("supplier") or "-"
-                posting = row.get("posting_date") or "-"
-                track_token = f"{PURCHASE_APPROVE_PREFIX}:{docname}"
-                text = "\n".join(
-                    [
-                        "#purchaseapprove",
-                        f"Kirim hujjati: {docname}",
-                        f"Yetkazib beruvchi: {supplier}",
-                        f"Status: {status}",
-                        track_token,
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"purchaseapprove-{idx}",
-                        title=f"{docname} ({status})",
-                        description=f"{supplier} • {posting}",
-                        input_message_content=InputTextMessageContent(text),
-                    )
-                )
-                if len(results) >= min(self.config.purchase_receipt_limit, 10):
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
-            return
+        await inline_query.answer(results, cache_time=0, is_personal=True)
 
-        elif purchase_item_mode:
-            search_term = trimmed_query[len(PURCHASE_ITEM_QUERY_PREFIX):].strip()
-            success, error_detail, rows = await self._fetch_items(
-                api_key,
-                api_secret,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Buyumlar ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            for idx, row in enumerate(rows):
-                item_name = row.get("item_name") or row.get("name") or row.get("item_code") or "Buyum"
-                item_code = row.get("item_code") or row.get("name") or "-"
-                uom = row.get("stock_uom") or "-"
-                text = "\n".join(
-                    [
-                        "#pritem",
-                        f"📦 {item_name}",
-                        f"Buyum kodi: {item_code}",
-                        f"UOM: {uom}",
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"purchaseitem-{idx}",
-                        title=f"{item_name} ({item_code})",
-                        description=f"UOM: {uom}",
-                        input_message_content=InputTextMessageContent(text),
-                    )
-                )
-                if len(results) >= self.config.item_limit:
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
+    async def _inline_purchase_approvals(
+        self, inline_query: InlineQuery, search_term: str, api_key: str, api_secret: str
+    ) -> None:
+        success, error_detail, rows = await self._fetch_purchase_receipts(
+            api_key,
+            api_secret,
+            query=search_term,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, "Kirim hujjatlari ro'yxatini olishda xatolik")
             return
-
-        elif supplier_mode:
-            search_term = trimmed_query[len(PURCHASE_SUPPLIER_QUERY_PREFIX):].strip()
-            success, error_detail, rows = await self._fetch_suppliers(
-                api_key,
-                api_secret,
-                limit=self.config.supplier_limit,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Yetkazib beruvchilar ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            lowered_term = search_term.lower()
-            for idx, row in enumerate(rows):
-                name = row.get("name") or "-"
-                label = row.get("supplier_name") or row.get("supplier_group") or name
-                if lowered_term and lowered_term not in name.lower() and lowered_term not in label.lower():
-                    continue
-                text = "\n".join(
-                    [
-                        "#supplier",
-                        f"Yetkazib beruvchi: {label}",
-                        f"Kod: {name}",
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"supplier-{idx}",
-                        title=label,
-                        description=name,
-                        input_message_content=InputTextMessageContent(text),
-                    )
+        rows = [row for row in rows if row.get("name")][: min(self.config.purchase_receipt_limit, 10)]
+        results = []
+        for idx, row in enumerate(rows):
+            docname = row["name"]
+            status = self._docstatus_label(row.get("docstatus"))
+            supplier = row.get("supplier") or "-"
+            posting = row.get("posting_date") or "-"
+            text = PURCHASE_APPROVE_RESULT_TEMPLATE % (docname, supplier, status, docname)
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"purchaseapprove-{idx}",
+                    title=f"{docname} ({status})",
+                    description=f"{supplier} • {posting}",
+                    input_message_content=InputTextMessageContent(text),
                 )
-                if len(results) >= self.config.supplier_limit:
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
+            )
+        await inline_query.answer(results, cache_time=0, is_personal=True)
+
+    async def _inline_delivery_notes(
+        self, inline_query: InlineQuery, search_term: str, api_key: str, api_secret: str
+    ) -> None:
+        success, error_detail, rows = await self._fetch_delivery_notes(
+            api_key,
+            api_secret,
+            query=search_term,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, "Chiqqan mahsulot hujjatlari ro'yxatini olishda xatolik")
             return
 
-        elif delivery_mode:
-            search_term = trimmed_query[len(DELIVERY_TRIGGER):].strip()
-            success, error_detail, rows = await self._fetch_delivery_notes(
-                api_key,
-                api_secret,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Chiqqan mahsulot hujjatlari ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
+        rows = [row for row in rows if row.get("name")][: min(self.config.delivery_note_limit, 10)]
+        details = self._start_detail_fetches(self._fetch_delivery_note_detail, api_key, api_secret, rows)
+        results = []
+        for idx, (row, pending) in enumerate(zip(rows, details)):
+            detail_success, _, detail = await pending
+            docname = row["name"]
+            message_text = self._format_delivery_note_message(row, detail if detail_success else None)
+            title = f"{docname} ({row.get('customer') or '-'})"
+            posting = row.get("posting_date") or "-"
+            description = f"{posting} • {row.get('customer') or '-'}"
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"delivery-{idx}",
+                    title=title,
+                    description=description,
+                    input_message_content=InputTextMessageContent(message_text),
                 )
-                return
+            )
 
-            results = []
-            for idx, row in enumerate(rows):
-                docname = row.get("name")
-                if not docname:
-                    continue
-                detail_success, _, detail = await self._fetch_delivery_note_detail(
-                    api_key, api_secret, docname
-                )
-                message_text = self._format_delivery_note_message(row, detail if detail_success else None)
-                title = f"{docname} ({row.get('customer') or '-'})"
-                posting = row.get("posting_date") or "-"
-                description = f"{posting} • {row.get('customer') or '-'}"
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"delivery-{idx}",
-                        title=title,
-                        description=description,
-                        input_message_content=InputTextMessageContent(message_text),
-                    )
-                )
-                if len(results) >= min(self.config.delivery_note_limit, 10):
-                    break
+        await inline_query.answer(results, cache_time=0, is_personal=True)
 
-            await inline_query.answer(results, cache_time=0, is_personal=True)
+    async def _inline_delivery_approvals(
+        self, inline_query: InlineQuery, search_term: str, api_key: str, api_secret: str
+    ) -> None:
+        success, error_detail, rows = await self._fetch_delivery_notes(
+            api_key,
+            api_secret,
+            query=search_term,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, "Chiqqan mahsulot hujjatlari ro'yxatini olishda xatolik")
             return
-
-        elif delivery_approve_mode:
-            active_prefix = next(
-                (prefix for prefix in DELIVERY_APPROVE_QUERY_PREFIXES if lower_query.startswith(prefix)), ""
-            )
-            search_term = trimmed_query[len(active_prefix):].strip()
-            success, error_detail, rows = await self._fetch_delivery_notes(
-                api_key,
-                api_secret,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Chiqqan mahsulot hujjatlari ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            for idx, row in enumerate(rows):
-                docname = row.get("name")
-                if not docname:
-                    continue
-                status = self._docstatus_label(row.get("docstatus"))
-                customer = row.get("customer") or "-"
-                posting = row.get("posting_date") or "-"
-                track_token = f"{DELIVERY_APPROVE_PREFIX}:{docname}"
-                text = "\n".join(
-                    [
-                        "#deliveryapprove",
-                        f"Chiqqan mahsulot hujjati: {docname}",
-                        f"Customer: {customer}",
-                        f"Status: {status}",
-                        track_token,
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"deliveryapprove-{idx}",
-                        title=f"{docname} ({status})",
-                        description=f"{customer} • {posting}",
-                        input_message_content=InputTextMessageContent(text),
-                    )
+        rows = [row for row in rows if row.get("name")][: min(self.config.delivery_note_limit, 10)]
+        results = []
+        for idx, row in enumerate(rows):
+            docname = row["name"]
+            status = self._docstatus_label(row.get("docstatus"))
+            customer = row.get("customer") or "-"
+            posting = row.get("posting_date") or "-"
+            text = DELIVERY_APPROVE_RESULT_TEMPLATE % (docname, customer, status, docname)
+            results.append(
+                InlineQueryResultArticle(
+                    id=f"deliveryapprove-{idx}",
+                    title=f"{docname} ({status})",
+                    description=f"{customer} • {posting}",
+                    input_message_content=InputTextMessageContent(text),
                 )
-                if len(results) >= min(self.config.delivery_note_limit, 10):
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
-            return
-
-        elif delivery_item_mode:
-            search_term = trimmed_query[len(DELIVERY_ITEM_QUERY_PREFIX):].strip()
-            success, error_detail, rows = await self._fetch_items(
-                api_key,
-                api_secret,
-                query=search_term,
             )
-            if not success:
-                hint = error_detail or "Buyumlar ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            for idx, row in enumerate(rows):
-                item_name = row.get("item_name") or row.get("name") or row.get("item_code") or "Buyum"
-                item_code = row.get("item_code") or row.get("name") or "-"
-                uom = row.get("stock_uom") or "-"
-                text = "\n".join(
-                    [
-                        "#dnitem",
-                        f"📦 {item_name}",
-                        f"Buyum kodi: {item_code}",
-                        f"UOM: {uom}",
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"deliveryitem-{idx}",
-                        title=f"{item_name} ({item_code})",
-                        description=f"UOM: {uom}",
-                        input_message_content=InputTextMessageContent(text),
-                    )
-                )
-                if len(results) >= self.config.item_limit:
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
+        await inline_query.answer(results, cache_time=0, is_personal=True)
+
+    async def _inline_item_picker(
+        self,
+        spec: ItemPickerSpec,
+        inline_query: InlineQuery,
+        search_term: str,
+        api_key: str,
+        api_secret: str,
+    ) -> None:
+        success, error_detail, rows = await self._reference_rows(
+            self._fetch_items,
+            api_key,
+            api_secret,
+            query=search_term,
+            fields=ITEM_PICKER_FIELDS,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, "Buyumlar ro'yxatini olishda xatolik")
             return
+        results = self._item_picker_results(rows, spec)
+        await inline_query.answer(results, cache_time=self.config.reference_cache_time, is_personal=True)
 
-        elif customer_mode:
-            search_term = trimmed_query[len(DELIVERY_CUSTOMER_QUERY_PREFIX):].strip()
-            success, error_detail, rows = await self._fetch_customers(
-                api_key,
-                api_secret,
-                limit=self.config.customer_limit,
-                query=search_term,
-            )
-            if not success:
-                hint = error_detail or "Customer ro'yxatini olishda xatolik"
-                await inline_query.answer(
-                    [],
-                    is_personal=True,
-                    cache_time=3,
-                    button=self._inline_start_button(hint[:48]),
-                )
-                return
-            results = []
-            lowered_term = search_term.lower()
-            for idx, row in enumerate(rows):
-                name = row.get("name") or "-"
-                label = row.get("customer_name") or row.get("customer_group") or name
-                if lowered_term and lowered_term not in name.lower() and lowered_term not in label.lower():
-                    continue
-                text = "\n".join(
-                    [
-                        "#customer",
-                        f"Customer: {label}",
-                        f"Code: {name}",
-                    ]
-                )
-                results.append(
-                    InlineQueryResultArticle(
-                        id=f"customer-{idx}",
-                        title=label,
-                        description=name,
-                        input_message_content=InputTextMessageContent(text),
-                    )
-                )
-                if len(results) >= self.config.customer_limit:
-                    break
-            await inline_query.answer(results, cache_time=0, is_personal=True)
+    async def _inline_labelled_picker(
+        self,
+        spec: LabelledPickerSpec,
+        inline_query: InlineQuery,
+        search_term: str,
+        api_key: str,
+        api_secret: str,
+    ) -> None:
+        limit = getattr(self.config, spec.limit_setting)
+        success, error_detail, rows = await self._reference_rows(
+            getattr(self, spec.fetch),
+            api_key,
+            api_secret,
+            ttl=REFERENCE_LIST_TTL,
+            limit=limit,
+            query=search_term,
+        )
+        if not success:
+            await self._answer_inline_error(inline_query, error_detail, spec.error_hint)
             return
+        results = self._labelled_picker_results(rows, spec)
+        await inline_query.answer(results, cache_time=self.config.reference_cache_time, is_personal=True)
 
-        query_text = trimmed_query
-        if lower_query in {"items", "bot items"}:
-            query_text = ""
-        success, error_detail, rows = await self._fetch_items(
+    async def _inline_items(
+        self, inline_query: InlineQuery, search_term: str, api_key: str, api_secret: str
+    ) -> None:
+        success, error_detail, rows = await self._reference_rows(
+            self._fetch_items,
             api_key,
             api_secret,
-            query=query_text,
+            query=search_term,
         )
         if not success:
-            hint = error_detail or "ERPNext bilan aloqa yo'q"
-            await inline_query.answer(
-                [],
-                is_personal=True,
-                cache_time=3,
-                button=self._inline_start_button(hint[:48]),
-            )
+            await self._answer_inline_error(inline_query, error_detail, "ERPNext bilan aloqa yo'q")
             return
 
         results = []
-        for idx, row in enumerate(rows):
+        for idx, row in enumerate(rows[: self.config.item_limit]):
             item_name = row.get("item_name") or row.get("name") or row.get("item_code") or "Buyum"
             item_code = row.get("item_code") or row.get("name") or ""
             uom = row.get("stock_uom") or "-"
@@ -2335,35 +2347,41 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                     input_message_content=InputTextMessageContent(text),
                 )
             )
-            if len(results) >= self.config.item_limit:
-                break
 
-        await inline_query.answer(results, cache_time=0, is_personal=True)
+        await inline_query.answer(results, cache_time=self.config.reference_cache_time, is_personal=True)
 
     async def handle_error(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
         logger.exception("Stock bot error: %s", context.error)
 
     # ------------------------------------------------------------ ERP helpers
+    async def _erp_call(self, request: Callable[[], Awaitable[Any]]) -> Any:
+        if time.monotonic() < self._erp_open_until:
+            raise RuntimeError("ERPNext vaqtincha javob bermayapti, birozdan so'ng qayta urinib ko'ring.")
+        async with self._erp_slots:
+            try:
+                result = await request()
+            except httpx.TransportError:
+                self._erp_failures += 1
+                if self._erp_failures >= ERP_BREAKER_THRESHOLD:
+                    self._erp_open_until = time.monotonic() + ERP_BREAKER_COOLDOWN
+                    logger.warning("ERPNext unreachable, pausing requests for %.0fs", ERP_BREAKER_COOLDOWN)
+                raise
+        self._erp_failures = 0
+        return result
+
     async def _verify_credentials(self, api_key: str, api_secret: str) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}{self.config.verify_endpoint}"
+        endpoint = self.config.verify_endpoint
 
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, timeout=10)
+        async def _request() -> Tuple[bool, Optional[str]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers)
             if 200 <= response.status_code < 300:
                 return True, None
-            try:
-                data = response.json()
-                detail = data.get("message") or data.get("exception") or str(data)
-            except ValueError:
-                detail = response.text
+            detail = self._erp_error_detail(response)
             return False, f"HTTP {response.status_code}: {detail}"
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Credential verification failed: %s", exc)
             return False, str(exc)
@@ -2374,13 +2392,13 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         *,
         query: str = "",
+        limit: Optional[int] = None,
+        fields: str = ITEM_LIST_FIELDS,
     ) -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Item"
+        endpoint = "/api/resource/Item"
         params = {
-            "fields": json.dumps(
-                ["name", "item_code", "item_name", "item_group", "stock_uom", "description", "standard_rate"]
-            ),
-            "limit_page_length": str(self.config.item_limit),
+            "fields": fields,
+            "limit_page_length": str(limit or self.config.item_limit),
             "order_by": "item_name asc",
         }
         query = query.strip()
@@ -2397,23 +2415,16 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
                         ["Item", "item_code", "like", f"%{transliterated}%"],
                     ]
                 )
-            params["or_filters"] = json.dumps(or_filters)
+            params["or_filters"] = orjson.dumps(or_filters).decode()
 
-        def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers, params=params)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", []
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "ERPNext javobini JSON tarzida o'qib bo'lmadi.", []
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -2422,7 +2433,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             return True, None, data  # type: ignore[list-item]
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("ERPNext itemlarini olishda xatolik: %s", exc)
             return False, str(exc), []
@@ -2435,32 +2446,29 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         limit: int = 25,
         query: str = "",
     ) -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Warehouse"
+        endpoint = "/api/resource/Warehouse"
         params = {
-            "fields": json.dumps(["name", "warehouse_name"]),
+            "fields": WAREHOUSE_LIST_FIELDS,
             "limit_page_length": str(limit),
             "order_by": "warehouse_name asc",
         }
         query = (query or "").strip()
         if query:
-            filters = [["Warehouse", "warehouse_name", "like", f"%{query}%"]]
-            params["filters"] = json.dumps(filters)
+            params["or_filters"] = orjson.dumps(
+                [
+                    ["Warehouse", "name", "like", f"%{query}%"],
+                    ["Warehouse", "warehouse_name", "like", f"%{query}%"],
+                ]
+            ).decode()
 
-        def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers, params=params)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", []
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Warehouse javobini JSON tarzida o'qib bo'lmadi.", []
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -2469,7 +2477,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             return True, None, data  # type: ignore[list-item]
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Warehouse ro'yxatini olishda xatolik: %s", exc)
             return False, str(exc), []
@@ -2482,31 +2490,29 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         limit: int = 25,
         query: str = "",
     ) -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Supplier"
+        endpoint = "/api/resource/Supplier"
         params = {
-            "fields": json.dumps(["name", "supplier_name", "supplier_group"]),
+            "fields": SUPPLIER_LIST_FIELDS,
             "limit_page_length": str(limit),
             "order_by": "supplier_name asc",
         }
         query = (query or "").strip()
         if query:
-            params["filters"] = json.dumps([["Supplier", "supplier_name", "like", f"%{query}%"]])
+            params["or_filters"] = orjson.dumps(
+                [
+                    ["Supplier", "name", "like", f"%{query}%"],
+                    ["Supplier", "supplier_name", "like", f"%{query}%"],
+                ]
+            ).decode()
 
-        def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers, params=params)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", []
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Yetkazib beruvchilar javobini JSON tarzida o'qib bo'lmadi.", []
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -2515,7 +2521,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             return True, None, data  # type: ignore[list-item]
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Yetkazib beruvchilar ro'yxatini olishda xatolik: %s", exc)
             return False, str(exc), []
@@ -2526,46 +2532,27 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         *,
         query: str = "",
+        limit: Optional[int] = None,
     ) -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/{quote('Stock Entry', safe='')}"
+        endpoint = STOCK_ENTRY_RESOURCE
         params = {
-            "fields": json.dumps(
-                [
-                    "name",
-                    "purpose",
-                    "stock_entry_type",
-                    "posting_date",
-                    "posting_time",
-                    "from_warehouse",
-                    "to_warehouse",
-                    "total_outgoing_value",
-                    "total_incoming_value",
-                    "docstatus",
-                ]
-            ),
-            "limit_page_length": str(min(self.config.item_limit, 15)),
+            "fields": STOCK_ENTRY_LIST_FIELDS,
+            "limit_page_length": str(limit or min(self.config.item_limit, 15)),
             "order_by": "posting_date desc",
         }
         if query:
-            params["filters"] = json.dumps(
+            params["filters"] = orjson.dumps(
                 [["Stock Entry", "name", "like", f"%{query}%"]]
-            )
+            ).decode()
 
-        def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers, params=params)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", []
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "ERPNext javobini JSON tarzida o'qib bo'lmadi.", []
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -2574,34 +2561,76 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             return True, None, data  # type: ignore[list-item]
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Stock Entry ro'yxatini olishda xatolik: %s", exc)
             return False, str(exc), []
 
+    def _detail_task(
+        self,
+        fetch: Callable[[str, str, str], Awaitable[DetailResult]],
+        api_key: str,
+        api_secret: str,
+        docname: str,
+    ) -> asyncio.Task:
+        cache = self._detail_cache
+        inflight = self._detail_inflight
+        key = (docname, fetch.__name__, api_key)
+
+        async def _bounded() -> DetailResult:
+            hit = cache.get(key)
+            if hit and time.monotonic() - hit[0] < DETAIL_CACHE_TTL:
+                return hit[1]
+            async with self._detail_slots:
+                result = await fetch(api_key, api_secret, docname)
+            if result[0] and inflight.get(key) is asyncio.current_task():
+                cache[key] = (time.monotonic(), result)
+                cache.move_to_end(key)
+                if len(cache) > DETAIL_CACHE_SIZE:
+                    cache.popitem(last=False)
+            return result
+
+        def _release(done: asyncio.Task) -> None:
+            if inflight.get(key) is done:
+                del inflight[key]
+
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(_bounded())
+            inflight[key] = task
+            task.add_done_callback(_release)
+        return task
+
+    def _start_detail_fetches(
+        self,
+        fetch: Callable[[str, str, str], Awaitable[DetailResult]],
+        api_key: str,
+        api_secret: str,
+        rows: List[Dict[str, Any]],
+    ) -> List[asyncio.Task]:
+        return [self._detail_task(fetch, api_key, api_secret, row["name"]) for row in rows]
+
+    def _forget_detail(self, docname: str) -> None:
+        for table in (self._detail_cache, self._detail_inflight):
+            for key in [key for key in table if key[0] == docname]:
+                del table[key]
+
     async def _fetch_stock_entry_detail(
         self,
         api_key: str,
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str], Dict[str, Any]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Stock Entry/{quote(docname, safe='')}"
+        endpoint = f"{STOCK_ENTRY_RESOURCE}/{quote(docname, safe='')}"
 
-        def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", {}
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Stock Entry ma'lumotini JSON sifatida o'qib bo'lmadi.", {}
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -2610,7 +2639,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             return True, None, data
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Stock Entry tafsilotlarini olishda xatolik: %s", exc)
             return False, str(exc), {}
@@ -2621,23 +2650,16 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str], Dict[str, Any]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Item/{quote(docname, safe='')}"
+        endpoint = f"/api/resource/Item/{quote(docname, safe='')}"
 
-        def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", {}
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Buyum tafsilotini JSON tarzida o'qib bo'lmadi.", {}
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -2646,7 +2668,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
             return True, None, data
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Buyum tafsilotlarini olishda xatolik: %s", exc)
             return False, str(exc), {}
@@ -2662,149 +2684,120 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         item: Dict[str, Any],
         quantity: float,
     ) -> Tuple[bool, Optional[str], Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Stock Entry"
+        endpoint = STOCK_ENTRY_RESOURCE
         uom = item.get("uom") or item.get("stock_uom") or "Nos"
-        item_payload = {
-            "item_code": item.get("code"),
-            "item_name": item.get("name"),
-            "qty": quantity,
-            "uom": uom,
-            "stock_uom": uom,
-        }
-        if warehouse_role == "target":
-            item_payload["t_warehouse"] = warehouse
-        else:
-            item_payload["s_warehouse"] = warehouse
+        row_field, entry_field = ENTRY_WAREHOUSE_FIELDS.get(warehouse_role, ENTRY_WAREHOUSE_FIELDS["source"])
         payload = {
             "company": self.config.default_company,
             "stock_entry_type": stock_entry_type,
-            "items": [item_payload],
+            "items": [
+                {
+                    "item_code": item.get("code"),
+                    "item_name": item.get("name"),
+                    "qty": quantity,
+                    "uom": uom,
+                    "stock_uom": uom,
+                    row_field: warehouse,
+                }
+            ],
             "naming_series": self.config.entry_series_template,
+            entry_field: warehouse,
         }
-        if warehouse_role == "target":
-            payload["to_warehouse"] = warehouse
-        else:
-            payload["from_warehouse"] = warehouse
 
-        def _request() -> Tuple[bool, Optional[str], Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = (
-                        body.get("message")
-                        or body.get("exception")
-                        or body.get("_server_messages")
-                        or str(body)
-                    )
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], Optional[str]]:
+            headers = self._json_auth_headers(api_key, api_secret)
+            response = await self._http.post(endpoint, headers=headers, content=orjson.dumps(payload), timeout=15)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", None
             try:
-                data = response.json().get("data")
+                data = orjson.loads(response.content).get("data")
                 docname = data.get("name") if isinstance(data, dict) else None
             except Exception:  # noqa: BLE001
                 docname = None
             return True, None, docname
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Stock Entry yaratishda xatolik: %s", exc)
             return False, str(exc), None
 
-    async def _submit_stock_entry(
+    async def _run_doc_method(
         self,
         api_key: str,
         api_secret: str,
+        doctype: str,
         docname: str,
+        method: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/method/run_doc_method"
-
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            payload = {"dt": "Stock Entry", "dn": docname, "method": "submit"}
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
+        endpoint = "/api/method/run_doc_method"
+
+        async def _request() -> Tuple[bool, Optional[str]]:
+            headers = self._json_auth_headers(api_key, api_secret)
+            payload = {"dt": doctype, "dn": docname, "method": method}
+            response = await self._http.post(endpoint, headers=headers, content=orjson.dumps(payload), timeout=15)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, detail
             return True, None
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
-            logger.warning("Stock Entry submitda xatolik: %s", exc)
+            logger.warning("%s %sda xatolik: %s", doctype, method, exc)
             return False, str(exc)
+        finally:
+            self._forget_detail(docname)
 
-    async def _cancel_stock_entry(
+    async def _delete_document(
         self,
         api_key: str,
         api_secret: str,
+        doctype: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/method/run_doc_method"
+        endpoint = f"/api/resource/{doctype}/{quote(docname, safe='')}"
 
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            payload = {"dt": "Stock Entry", "dn": docname, "method": "cancel"}
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.delete(endpoint, headers=headers, timeout=15)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, detail
             return True, None
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
-            logger.warning("Stock Entry cancelda xatolik: %s", exc)
+            logger.warning("%s ni o'chirishda xatolik: %s", doctype, exc)
             return False, str(exc)
+        finally:
+            self._forget_detail(docname)
 
-    async def _delete_stock_entry(
+    async def _submit_stock_entry(
         self,
         api_key: str,
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Stock Entry/{quote(docname, safe='')}"
+        return await self._run_doc_method(api_key, api_secret, "Stock Entry", docname, "submit")
 
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.delete(endpoint, headers=headers, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
-                return False, detail
-            return True, None
+    async def _cancel_stock_entry(
+        self,
+        api_key: str,
+        api_secret: str,
+        docname: str,
+    ) -> Tuple[bool, Optional[str]]:
+        return await self._run_doc_method(api_key, api_secret, "Stock Entry", docname, "cancel")
 
-        try:
-            return await asyncio.to_thread(_request)
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Stock Entry ni o'chirishda xatolik: %s", exc)
-            return False, str(exc)
+    async def _delete_stock_entry(
+        self,
+        api_key: str,
+        api_secret: str,
+        docname: str,
+    ) -> Tuple[bool, Optional[str]]:
+        return await self._delete_document(api_key, api_secret, "Stock Entry", docname)
 
     def _format_entry_error(self, error_detail: Optional[str]) -> str:
         if not error_detail:
@@ -2826,15 +2819,9 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         if not detail:
             return f"{action_label} bajarilmadi. ERPNext javobi olinmadi."
         cleaned = self._clean_text(detail).replace("\n", " ").strip()
-        lowered = cleaned.lower()
-        if "cannot delete or cancel" in lowered:
-            reason = (
-                "Bu hujjat ERPNext dagi boshqa hujjatlar (masalan, GL Entry yoki boshqa Stock Entry) bilan bog'langan. "
-                "Avval ularni bekor qilmasdan turib bu amaliyotni bajarib bo'lmaydi."
-            )
-            return f"{action_label} mumkin emas.\nSabab: {reason}\nERP xabari: {cleaned}"
-        if "negativestockerror" in lowered or "negative stock" in lowered:
-            reason = "Omborda yetarli qoldiq yo'q, shuning uchun ERPNext amaliyotni rad etdi."
+        match = ACTION_ERROR_RE.match(cleaned)
+        if match:
+            reason = ACTION_ERROR_REASONS[match.lastgroup]
             return f"{action_label} mumkin emas.\nSabab: {reason}\nERP xabari: {cleaned}"
         return f"{action_label} bajarilmadi.\nERP xabari: {cleaned}"
 
@@ -2855,45 +2842,49 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         out_value = summary.get("total_outgoing_value") or detail.get("total_outgoing_value") or "-"
         in_value = summary.get("total_incoming_value") or detail.get("total_incoming_value") or "-"
         items = detail.get("items")
-        if not from_wh or from_wh in {None, ""}:
-            if isinstance(items, list):
-                for item in items:
-                    if item.get("s_warehouse"):
-                        from_wh = item["s_warehouse"]
-                        break
-        if not to_wh or to_wh in {None, ""}:
-            if isinstance(items, list):
-                for item in items:
-                    if item.get("t_warehouse"):
-                        to_wh = item["t_warehouse"]
-                        break
+        if (not from_wh or not to_wh) and isinstance(items, list):
+            for item in items:
+                from_wh = from_wh or item.get("s_warehouse")
+                to_wh = to_wh or item.get("t_warehouse")
+                if from_wh and to_wh:
+                    break
         from_wh = from_wh or "-"
         to_wh = to_wh or "-"
         short_name = name[-5:] if len(name) > 5 else name
         lines = [
-            f"🚚 Stock Entry: {short_name}",
-            f"Maqsad: {purpose}",
-            f"Tur: {entry_type}",
-            f"Sana: {posting_date} {posting_time}",
-            f"Source Warehouse: {from_wh}",
-            f"Target Warehouse: {to_wh}",
-            f"Qiymat: chiqish {out_value}, kirish {in_value}",
-            f"Status: {self._docstatus_label(detail.get('docstatus'))}",
+            STOCK_ENTRY_HEADER_TEMPLATE
+            % (
+                short_name,
+                purpose,
+                entry_type,
+                posting_date,
+                posting_time,
+                from_wh,
+                to_wh,
+                out_value,
+                in_value,
+                self._docstatus_label(detail.get("docstatus")),
+            )
         ]
         if isinstance(items, list) and items:
             lines.append("")
             max_items = 10
+            append = lines.append
             for item in items[:max_items]:
-                item_code = item.get("item_code") or "-"
-                item_name = item.get("item_name") or ""
-                qty = item.get("qty")
-                uom = item.get("uom") or ""
-                s_wh = item.get("s_warehouse") or from_wh
-                t_wh = item.get("t_warehouse") or to_wh
-                qty_part = f"{qty} {uom}".strip()
+                get = item.get
+                item_code = get("item_code") or "-"
+                item_name = get("item_name") or ""
+                qty_part = f"{get('qty')} {get('uom') or ''}".strip()
                 label = item_name if item_name and item_name != item_code else ""
-                lines.append(
-                    f"• {item_code} {label} — {qty_part or '—'} ({s_wh} → {t_wh})"
+                append(
+                    STOCK_ENTRY_ROW_TEMPLATE
+                    % (
+                        item_code,
+                        label,
+                        qty_part or "—",
+                        get("s_warehouse") or from_wh,
+                        get("t_warehouse") or to_wh,
+                    )
                 )
             if len(items) > max_items:
                 lines.append(f"... va yana {len(items) - max_items} ta pozitsiya")
@@ -2916,25 +2907,35 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         warehouse = warehouse or "-"
         total = detail.get("grand_total") or summary.get("grand_total") or "-"
         lines = [
-            f"🧾 Kirim hujjati: {name}",
-            f"Yetkazib beruvchi: {supplier}",
-            f"Sana: {posting_date} {posting_time}",
-            f"Ombor: {warehouse}",
-            f"Jami: {total}",
-            f"Status: {self._docstatus_label(detail.get('docstatus'))}",
+            PURCHASE_RECEIPT_HEADER_TEMPLATE
+            % (
+                name,
+                supplier,
+                posting_date,
+                posting_time,
+                warehouse,
+                total,
+                self._docstatus_label(detail.get("docstatus")),
+            )
         ]
         if isinstance(items, list) and items:
             lines.append("")
             max_items = 10
+            append = lines.append
             for item in items[:max_items]:
-                item_code = item.get("item_code") or "-"
-                item_name = item.get("item_name") or ""
-                accepted = item.get("accepted_qty") or item.get("qty") or "-"
-                rejected = item.get("rejected_qty") or 0
-                rate = item.get("rate") or "-"
+                get = item.get
+                item_code = get("item_code") or "-"
+                item_name = get("item_name") or ""
                 label = item_name if item_name and item_name != item_code else ""
-                lines.append(
-                    f"• {item_code} {label} — Qabul: {accepted}, Reject: {rejected}, Rate: {rate}"
+                append(
+                    PURCHASE_RECEIPT_ROW_TEMPLATE
+                    % (
+                        item_code,
+                        label,
+                        get("accepted_qty") or get("qty") or "-",
+                        get("rejected_qty") or 0,
+                        get("rate") or "-",
+                    )
                 )
             if len(items) > max_items:
                 lines.append(f"... va yana {len(items) - max_items} ta buyum")
@@ -2950,23 +2951,17 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> bool:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines:
-            return False
-        token_line = next((line for line in lines if line.startswith(f"{ENTRY_APPROVE_PREFIX}:")), None)
-        if not token_line:
-            return False
-        _, docname = token_line.split(":", 1)
-        docname = docname.strip()
+        docname = find_token_value(text, ENTRY_APPROVE_PREFIX)
         if not docname:
             return False
-        success, error_detail, detail = await self._fetch_stock_entry_detail(api_key, api_secret, docname)
+        success, error_detail, detail = await self._detail_task(
+            self._fetch_stock_entry_detail, api_key, api_secret, docname
+        )
         if not success:
             fallback = error_detail or "Ma'lumot topilmadi."
             await message.reply_text(f"Tasdiqlashda xatolik:\n{fallback}")
             return True
-        summary = detail.copy()
-        text_message = self._format_stock_entry_message(summary, detail)
+        text_message = self._format_stock_entry_message(detail, detail)
         markup = self._entry_action_buttons(detail)
         await message.reply_text(text_message, reply_markup=markup)
         self.storage.delete_entry_draft(user_id)
@@ -2976,35 +2971,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         docname = detail.get("name")
         if not docname:
             return None
-        docstatus = detail.get("docstatus")
-        buttons: list[list[InlineKeyboardButton]] = []
-        if docstatus == 0:
-            buttons.append(
-                [
-                    InlineKeyboardButton("✅ Tasdiqlash", callback_data=f"{ENTRY_APPROVE_PREFIX}:{docname}"),
-                    InlineKeyboardButton("🗑️ O'chirish", callback_data=f"{ENTRY_DELETE_PREFIX}:{docname}"),
-                ]
-            )
-            buttons.append(
-                [
-                    InlineKeyboardButton(
-                        "📁 Saqlab chiqish", callback_data=f"{ENTRY_DISMISS_PREFIX}:{docname}"
-                    )
-                ]
-            )
-        elif docstatus == 1:
-            buttons.append(
-                [
-                    InlineKeyboardButton("❌ Bekor qilish", callback_data=f"{ENTRY_CANCEL_PREFIX}:{docname}"),
-                ]
-            )
-        else:
-            buttons.append(
-                [
-                    InlineKeyboardButton("🗑️ O'chirish", callback_data=f"{ENTRY_DELETE_PREFIX}:{docname}"),
-                ]
-            )
-        return InlineKeyboardMarkup(buttons)
+        return _entry_action_markup(docname, detail.get("docstatus"))
 
     @staticmethod
     def _format_item_message(detail: Dict[str, Any]) -> str:
@@ -3015,12 +2982,7 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         description = detail.get("description")
         standard_rate = detail.get("standard_rate")
         disabled = detail.get("disabled")
-        lines = [
-            f"📦 Buyum: {name}",
-            f"Kod: {code}",
-            f"Guruhi: {group}",
-            f"O'lchov birligi: {uom}",
-        ]
+        lines = [ITEM_HEADER_TEMPLATE % (name, code, group, uom)]
         if standard_rate not in (None, ""):
             lines.append(f"Narx: {standard_rate}")
         if disabled:
@@ -3031,12 +2993,25 @@ class StockManagerBot(DeliveryFlowMixin, PurchaseFlowMixin):
         return "\n".join(lines)
 
 
+def _start_log_listener() -> QueueListener:
+    root = logging.getLogger()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [QueueHandler(log_queue)]
+    listener.start()
+    return listener
+
+
 def main() -> None:
     logging.basicConfig(level=logging.INFO)
-    load_dotenv()
-    config = load_config()
-    bot = StockManagerBot(config)
-    bot.application.run_polling(drop_pending_updates=True)
+    listener = _start_log_listener()
+    try:
+        load_dotenv()
+        config = load_config()
+        bot = StockManagerBot(config)
+        bot.application.run_polling(drop_pending_updates=True)
+    finally:
+        listener.stop()
 
 
 __all__ = ["StockManagerBot", "main"]
@@ -8,7 +8,7 @@ from typing import Mapping, MutableMapping, Optional
 DEFAULT_DB_PATH = Path("stock_manager_bot.sqlite3")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class StockBotConfig:
     token: str
     db_path: Path
@@ -24,6 +24,10 @@ class StockBotConfig:
     purchase_receipt_limit: int
     customer_limit: int
     delivery_note_limit: int
+    draft_ttl_minutes: int
+    erp_concurrency: int
+    detail_concurrency: int
+    reference_cache_time: int
 
 
 def _parse_limit(raw: Optional[str], fallback: int) -> int:
@@ -35,6 +39,15 @@ def _parse_limit(raw: Optional[str], fallback: int) -> int:
         return fallback
 
 
+def _parse_seconds(raw: Optional[str], fallback: int) -> int:
+    if not raw:
+        return fallback
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return fallback
+
+
 def load_config(env: Optional[Mapping[str, str]] = None) -> StockBotConfig:
     source = env or os.environ
 
@@ -64,6 +77,10 @@ def load_config(env: Optional[Mapping[str, str]] = None) -> StockBotConfig:
     purchase_receipt_limit = _parse_limit(source.get("PURCHASE_RECEIPT_LIMIT"), 25)
     customer_limit = _parse_limit(source.get("CUSTOMER_LIMIT"), 25)
     delivery_note_limit = _parse_limit(source.get("DELIVERY_NOTE_LIMIT"), 25)
+    draft_ttl_minutes = _parse_limit(source.get("DRAFT_TTL_MINUTES"), 120)
+    erp_concurrency = _parse_limit(source.get("ERP_CONCURRENCY"), 8)
+    detail_concurrency = _parse_limit(source.get("DETAIL_CONCURRENCY"), 5)
+    reference_cache_time = _parse_seconds(source.get("REFERENCE_CACHE_TIME"), 30)
 
     entry_series = source.get("STOCK_ENTRY_SERIES") or "MAT-STE-.YYYY.-.#####"
     entry_series = entry_series.strip() or "MAT-STE-.YYYY.-.#####"
@@ -88,6 +105,10 @@ def load_config(env: Optional[Mapping[str, str]] = None) -> StockBotConfig:
         purchase_receipt_limit=purchase_receipt_limit,
         customer_limit=customer_limit,
         delivery_note_limit=delivery_note_limit,
+        draft_ttl_minutes=draft_ttl_minutes,
+        erp_concurrency=erp_concurrency,
+        detail_concurrency=detail_concurrency,
+        reference_cache_time=reference_cache_time,
     )
 
 
@@ -1,13 +1,13 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 from datetime import datetime
 from typing import Any, Dict, Optional, Tuple
 
 from urllib.parse import quote
-import requests
+
+import orjson
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -18,6 +18,19 @@ from telegram import (
 from telegram.constants import ChatType
 from telegram.ext import ContextTypes
 
+from .parsing import (
+    CUSTOMER_FIELDS,
+    NO_VALUES,
+    SKIP_VALUES,
+    YES_VALUES,
+    find_token_value,
+    parse_date,
+    parse_item_inline,
+    parse_labelled_inline,
+    parse_number,
+    parse_time,
+)
+
 logger = logging.getLogger(__name__)
 
 DELIVERY_TRIGGER = "delivery"
@@ -31,6 +44,65 @@ DELIVERY_DELETE_PREFIX = "delivery-delete"
 DELIVERY_CONFIRM_CALLBACK = "delivery:confirm"
 DELIVERY_APPROVE_QUERY_PREFIXES = ("deliveryapprove", "dnapprove")
 DELIVERY_DISMISS_PREFIX = "delivery-dismiss"
+DELIVERY_NOTE_RESOURCE = "/api/resource/" + quote("Delivery Note", safe="")
+DELIVERY_NOTE_LIST_FIELDS = orjson.dumps(
+    [
+        "name",
+        "customer",
+        "posting_date",
+        "posting_time",
+        "set_warehouse",
+        "grand_total",
+        "docstatus",
+    ]
+).decode()
+DELIVERY_NOTE_HEADER_TEMPLATE = (
+    "🚚 Chiqqan mahsulot hujjati: %s\nMijoz: %s\nSana: %s %s\nOmbor: %s\nJami: %s\nStatus: %s"
+)
+DELIVERY_NOTE_ROW_TEMPLATE = "• %s %s — %s %s (Narx: %s)"
+CUSTOMER_LIST_FIELDS = orjson.dumps(["name", "customer_name", "customer_group"]).decode()
+
+DELIVERY_CANCEL_BUTTON = InlineKeyboardButton(
+    "❌ Jarayonni bekor qilish", callback_data=f"{DELIVERY_CREATE_PREFIX}:cancel"
+)
+DELIVERY_SKIP_BUTTON = InlineKeyboardButton(
+    "⏭ O'tkazib yuborish", callback_data=f"{DELIVERY_CREATE_PREFIX}:skip"
+)
+DELIVERY_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Ko'rish", switch_inline_query_current_chat=DELIVERY_TRIGGER)],
+        [InlineKeyboardButton("➕ Yangi rasmiylashtirish", callback_data=DELIVERY_CALLBACK_CREATE)],
+        [InlineKeyboardButton("✔️ Tasdiqlash", callback_data=DELIVERY_CONFIRM_CALLBACK)],
+    ]
+)
+DELIVERY_CANCEL_MARKUP = InlineKeyboardMarkup([[DELIVERY_CANCEL_BUTTON]])
+DELIVERY_SKIP_MARKUP = InlineKeyboardMarkup([[DELIVERY_SKIP_BUTTON], [DELIVERY_CANCEL_BUTTON]])
+DELIVERY_YES_NO_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("Ha", callback_data=f"{DELIVERY_CREATE_PREFIX}:yn:yes"),
+            InlineKeyboardButton("Yo'q", callback_data=f"{DELIVERY_CREATE_PREFIX}:yn:no"),
+        ],
+        [DELIVERY_CANCEL_BUTTON],
+    ]
+)
+DELIVERY_ITEMS_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("📦 Buyum qidirish", switch_inline_query_current_chat=f"{DELIVERY_ITEM_QUERY_PREFIX} ")],
+        [InlineKeyboardButton("✅ Rasmiylashtirishni yakunlash", callback_data=f"{DELIVERY_CREATE_PREFIX}:finish")],
+        [DELIVERY_CANCEL_BUTTON],
+    ]
+)
+DELIVERY_APPROVE_INLINE_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton(
+                "🚚 Tasdiqlash oynasini ochish",
+                switch_inline_query_current_chat=f"{DELIVERY_APPROVE_QUERY_PREFIXES[0]} ",
+            )
+        ]
+    ]
+)
 
 
 class DeliveryFlowMixin:
@@ -38,42 +110,22 @@ class DeliveryFlowMixin:
 
     # ---------------------------------------------------------------- menus
     def _delivery_markup(self) -> InlineKeyboardMarkup:
-        view_button = InlineKeyboardButton(
-            "Ko'rish",
-            switch_inline_query_current_chat=DELIVERY_TRIGGER,
-        )
-        create_button = InlineKeyboardButton(
-            "➕ Yangi rasmiylashtirish", callback_data=DELIVERY_CALLBACK_CREATE
-        )
-        confirm_button = InlineKeyboardButton(
-            "✔️ Tasdiqlash", callback_data=DELIVERY_CONFIRM_CALLBACK
-        )
-        return InlineKeyboardMarkup([[view_button], [create_button], [confirm_button]])
+        return DELIVERY_MARKUP
 
     def _delivery_cancel_button(self) -> InlineKeyboardButton:
-        return InlineKeyboardButton(
-            "❌ Jarayonni bekor qilish", callback_data=f"{DELIVERY_CREATE_PREFIX}:cancel"
-        )
+        return DELIVERY_CANCEL_BUTTON
 
     def _delivery_cancel_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup([[self._delivery_cancel_button()]])
+        return DELIVERY_CANCEL_MARKUP
 
     def _delivery_skip_button(self) -> InlineKeyboardButton:
-        return InlineKeyboardButton("⏭ O'tkazib yuborish", callback_data=f"{DELIVERY_CREATE_PREFIX}:skip")
+        return DELIVERY_SKIP_BUTTON
 
     def _delivery_skip_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup([[self._delivery_skip_button()], [self._delivery_cancel_button()]])
+        return DELIVERY_SKIP_MARKUP
 
     def _delivery_yes_no_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup(
-            [
-                [
-                    InlineKeyboardButton("Ha", callback_data=f"{DELIVERY_CREATE_PREFIX}:yn:yes"),
-                    InlineKeyboardButton("Yo'q", callback_data=f"{DELIVERY_CREATE_PREFIX}:yn:no"),
-                ],
-                [self._delivery_cancel_button()],
-            ]
-        )
+        return DELIVERY_YES_NO_MARKUP
 
     # ---------------------------------------------------------- prompts/flow
     async def _start_delivery_note_creation(
@@ -89,8 +141,8 @@ class DeliveryFlowMixin:
             "stage": "dn_customer",
             "chat_id": chat_id,
             "series": self.config.delivery_note_series_template,
-            "posting_date": now.strftime("%Y-%m-%d"),
-            "posting_time": now.strftime("%H:%M"),
+            "posting_date": now.date().isoformat(),
+            "posting_time": f"{now.hour:02d}:{now.minute:02d}",
             "is_return": False,
             "items": [],
         }
@@ -187,22 +239,7 @@ class DeliveryFlowMixin:
         )
 
     def _delivery_items_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup(
-            [
-                [
-                    InlineKeyboardButton(
-                        "📦 Buyum qidirish",
-                        switch_inline_query_current_chat=f"{DELIVERY_ITEM_QUERY_PREFIX} ",
-                    )
-                ],
-                [
-                    InlineKeyboardButton(
-                        "✅ Rasmiylashtirishni yakunlash", callback_data=f"{DELIVERY_CREATE_PREFIX}:finish"
-                    )
-                ],
-                [self._delivery_cancel_button()],
-            ]
-        )
+        return DELIVERY_ITEMS_MARKUP
 
     async def _prompt_delivery_items_menu(
         self,
@@ -210,6 +247,7 @@ class DeliveryFlowMixin:
         chat_id: int,
         draft: Dict[str, Any],
         context: ContextTypes.DEFAULT_TYPE,
+        notice: Optional[str] = None,
     ) -> None:
         items = draft.get("items") or []
         if items:
@@ -221,6 +259,8 @@ class DeliveryFlowMixin:
             summary = "\n".join(lines)
         else:
             summary = "Hozircha item qo'shilmagan."
+        if notice:
+            summary = f"{notice}\n\n{summary}"
         await context.bot.send_message(
             chat_id=chat_id,
             text=summary + "\nYangi item qo'shish yoki hujjatni yakunlash uchun pastdagi tugmalardan foydalaning.",
@@ -230,51 +270,18 @@ class DeliveryFlowMixin:
     # ----------------------------------------------------------- parsers
     @staticmethod
     def _parse_delivery_customer(text: str) -> Optional[Dict[str, str]]:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines or not any("#customer" in line.lower() or "customer:" in line.lower() for line in lines):
-            return None
-        code = None
-        label = None
-        for line in lines:
-            lowered = line.lower()
-            if lowered.startswith("customer:"):
-                label = line.split(":", 1)[1].strip()
-            if lowered.startswith("code:"):
-                code = line.split(":", 1)[1].strip()
-        if not code:
-            code = label
-        if not code:
-            return None
-        return {"code": code, "label": label or code}
+        return parse_labelled_inline(text, ("#customer", "customer:"), CUSTOMER_FIELDS)
 
     @staticmethod
     def _parse_delivery_item(text: str) -> Optional[Dict[str, str]]:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines or not any("#dnitem" in line.lower() for line in lines):
-            return None
-        code = None
-        name = None
-        uom = None
-        for line in lines:
-            if line.startswith("📦"):
-                name = line.lstrip("📦").strip()
-            lowered = line.lower()
-            if lowered.startswith("item code:") or lowered.startswith("buyum kodi:"):
-                code = line.split(":", 1)[1].strip()
-            if lowered.startswith("uom:"):
-                uom = line.split(":", 1)[1].strip()
-        if not code:
-            return None
-        return {"code": code, "name": name or code, "uom": uom or "-"}
+        return parse_item_inline(text, ("#dnitem",))
 
     @staticmethod
     def _delivery_parse_yes_no(value: str) -> Optional[bool]:
         normalized = (value or "").strip().lower()
-        positives = {"ha", "ha.", "yes", "y", "true", "1"}
-        negatives = {"yo'q", "yoq", "yo'q.", "no", "n", "false", "0"}
-        if normalized in positives:
+        if normalized in YES_VALUES:
             return True
-        if normalized in negatives:
+        if normalized in NO_VALUES:
             return False
         return None
 
@@ -294,16 +301,6 @@ class DeliveryFlowMixin:
         stage = draft.get("stage")
         chat_id = draft.get("chat_id", message.chat_id)
         normalized = text.strip().lower()
-        skip_values = {
-            "skip",
-            "-",
-            "yo'q",
-            "yoq",
-            "otkaz",
-            "o'tkaz",
-            "otkazib yuborish",
-            "o'tkazib yuborish",
-        }
 
         if stage == "dn_customer":
             data = self._parse_delivery_customer(text)
@@ -321,13 +318,12 @@ class DeliveryFlowMixin:
             return True
 
         if stage == "dn_date":
-            if normalized not in skip_values:
-                try:
-                    parsed = datetime.strptime(text.strip(), "%Y-%m-%d")
-                    draft["posting_date"] = parsed.strftime("%Y-%m-%d")
-                except ValueError:
+            if normalized not in SKIP_VALUES:
+                posting_date = parse_date(text)
+                if not posting_date:
                     await message.reply_text("Sana formatini YYYY-MM-DD ko'rinishida yuboring.")
                     return True
+                draft["posting_date"] = posting_date
             draft["stage"] = "dn_time"
             self.storage.save_entry_draft(user_id, draft)
             await self._prompt_delivery_posting_time(
@@ -336,13 +332,12 @@ class DeliveryFlowMixin:
             return True
 
         if stage == "dn_time":
-            if normalized not in skip_values:
-                try:
-                    parsed = datetime.strptime(text.strip(), "%H:%M")
-                    draft["posting_time"] = parsed.strftime("%H:%M")
-                except ValueError:
+            if normalized not in SKIP_VALUES:
+                posting_time = parse_time(text)
+                if not posting_time:
                     await message.reply_text("Vaqt formatini HH:MM ko'rinishida yuboring.")
                     return True
+                draft["posting_time"] = posting_time
             draft["stage"] = "dn_is_return"
             self.storage.save_entry_draft(user_id, draft)
             await self._prompt_delivery_return_choice(chat_id=chat_id, context=context)
@@ -388,10 +383,8 @@ class DeliveryFlowMixin:
             return True
 
         if stage == "dn_item_qty":
-            normalized_qty = text.replace(",", ".")
-            try:
-                qty = float(normalized_qty)
-            except ValueError:
+            qty = parse_number(text)
+            if qty is None:
                 await message.reply_text("Miqdor noto'g'ri. Masalan: 25")
                 return True
             if qty <= 0:
@@ -409,13 +402,11 @@ class DeliveryFlowMixin:
             return True
 
         if stage == "dn_item_rate":
-            normalized_rate = text.replace(",", ".")
-            if normalized in skip_values:
+            if normalized in SKIP_VALUES:
                 rate = 0.0
             else:
-                try:
-                    rate = float(normalized_rate)
-                except ValueError:
+                rate = parse_number(text)
+                if rate is None:
                     await message.reply_text("Narx noto'g'ri. Masalan: 12000")
                     return True
                 if rate < 0:
@@ -439,11 +430,12 @@ class DeliveryFlowMixin:
             draft["current_item"] = None
             draft["stage"] = "dn_items_menu"
             self.storage.save_entry_draft(user_id, draft)
-            await message.reply_text(
-                f"{item_entry.get('name')} qo'shildi.",
-                reply_markup=self._delivery_cancel_markup(),
+            await self._prompt_delivery_items_menu(
+                chat_id=chat_id,
+                draft=draft,
+                context=context,
+                notice=f"{item_entry.get('name')} qo'shildi.",
             )
-            await self._prompt_delivery_items_menu(chat_id=chat_id, draft=draft, context=context)
             return True
 
         return False
@@ -456,12 +448,14 @@ class DeliveryFlowMixin:
         api_key: str,
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
+        banner: Optional[asyncio.Task] = None,
     ) -> None:
         customer = draft.get("customer")
         items = draft.get("items") or []
         source_warehouse = draft.get("source_warehouse")
         chat_id = draft.get("chat_id", user_id)
         if not customer or not source_warehouse or not items:
+            await self._settle(banner)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="Ma'lumotlar yetarli emas. Mijoz, ombor va kamida bitta buyumni tanlang.",
@@ -470,19 +464,18 @@ class DeliveryFlowMixin:
             draft["stage"] = "dn_items_menu"
             self.storage.save_entry_draft(user_id, draft)
             return
-        payload_items = []
-        for row in items:
-            payload_items.append(
-                {
-                    "item_code": row.get("code"),
-                    "item_name": row.get("name"),
-                    "qty": row.get("qty"),
-                    "uom": row.get("uom"),
-                    "rate": row.get("rate"),
-                    "amount": row.get("amount"),
-                    "warehouse": source_warehouse,
-                }
-            )
+        payload_items = [
+            {
+                "item_code": row["code"],
+                "item_name": row["name"],
+                "qty": row["qty"],
+                "uom": row["uom"],
+                "rate": row["rate"],
+                "amount": row["amount"],
+                "warehouse": source_warehouse,
+            }
+            for row in items
+        ]
         payload = {
             "customer": customer.get("code"),
             "posting_date": draft.get("posting_date"),
@@ -498,6 +491,7 @@ class DeliveryFlowMixin:
             api_secret,
             payload=payload,
         )
+        await self._settle(banner)
         if success:
             self.storage.delete_entry_draft(user_id)
             detail_success = False
@@ -509,8 +503,7 @@ class DeliveryFlowMixin:
                     docname,
                 )
             if detail_success:
-                summary = detail.copy()
-                text_message = self._format_delivery_note_message(summary, detail)
+                text_message = self._format_delivery_note_message(detail, detail)
                 markup = self._delivery_action_buttons(detail)
                 await context.bot.send_message(
                     chat_id=chat_id,
@@ -548,23 +541,17 @@ class DeliveryFlowMixin:
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> bool:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines:
-            return False
-        token_line = next((line for line in lines if line.startswith(f"{DELIVERY_APPROVE_PREFIX}:")), None)
-        if not token_line:
-            return False
-        _, docname = token_line.split(":", 1)
-        docname = docname.strip()
+        docname = find_token_value(text, DELIVERY_APPROVE_PREFIX)
         if not docname:
             return False
-        success, error_detail, detail = await self._fetch_delivery_note_detail(api_key, api_secret, docname)
+        success, error_detail, detail = await self._detail_task(
+            self._fetch_delivery_note_detail, api_key, api_secret, docname
+        )
         if not success:
             fallback = error_detail or "Ma'lumot topilmadi."
             await message.reply_text(f"Tasdiqlashda xatolik:\n{fallback}")
             return True
-        summary = detail.copy()
-        text_message = self._format_delivery_note_message(summary, detail)
+        text_message = self._format_delivery_note_message(detail, detail)
         markup = self._delivery_action_buttons(detail)
         await message.reply_text(text_message, reply_markup=markup)
         self.storage.delete_entry_draft(user_id)
@@ -577,12 +564,11 @@ class DeliveryFlowMixin:
         message = update.message
         if not chat or not user or not message or chat.type != ChatType.PRIVATE:
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
+        credentials = self._active_credentials(user.id)
+        if credentials is None:
             await message.reply_text("Avval /start orqali API kalit va secret ni tasdiqlang.")
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         await self._send_delivery_preview(
             chat_id=chat.id,
             api_key=api_key,
@@ -604,12 +590,10 @@ class DeliveryFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key")
-        api_secret = creds.get("api_secret")
+        api_key, api_secret = credentials
         if not api_key or not api_secret:
             await query.answer("API kalitlari topilmadi.", show_alert=True)
             return
@@ -629,20 +613,16 @@ class DeliveryFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        parts = (query.data or "").split(":", 2)
-        action = parts[1] if len(parts) > 1 else ""
-        value = parts[2] if len(parts) > 2 else ""
+        action, _, value = (query.data or "").partition(":")[2].partition(":")
         draft = self.storage.get_entry_draft(user.id)
         if not draft or draft.get("kind") != "delivery_note":
             await query.answer("Chiqqan mahsulot hujjati jarayoni topilmadi.", show_alert=True)
             return
         chat_id = draft.get("chat_id") or (query.message.chat_id if query.message else user.id)
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
 
         if action == "finish":
             if not draft.get("customer"):
@@ -657,13 +637,15 @@ class DeliveryFlowMixin:
             draft["stage"] = "dn_submitting"
             self.storage.save_entry_draft(user.id, draft)
             await query.answer("Yaratilmoqda…", show_alert=False)
-            await context.bot.send_message(chat_id=chat_id, text="⏳ Chiqqan mahsulot hujjati yaratilmoqda...")
             await self._finalise_delivery_note_creation(
                 user_id=user.id,
                 draft=draft,
                 api_key=api_key,
                 api_secret=api_secret,
                 context=context,
+                banner=self._spawn(
+                    context.bot.send_message(chat_id=chat_id, text="⏳ Chiqqan mahsulot hujjati yaratilmoqda...")
+                ),
             )
             return
 
@@ -694,7 +676,7 @@ class DeliveryFlowMixin:
             stage = draft.get("stage")
             if stage == "dn_date":
                 draft["stage"] = "dn_time"
-                self.storage.save_entry_draft(user.id, draft)
+                self.storage.update_entry_draft_stage(user.id, "dn_time")
                 await query.answer("O'tkazildi.", show_alert=False)
                 await self._prompt_delivery_posting_time(
                     chat_id=chat_id,
@@ -704,7 +686,7 @@ class DeliveryFlowMixin:
                 return
             if stage == "dn_time":
                 draft["stage"] = "dn_is_return"
-                self.storage.save_entry_draft(user.id, draft)
+                self.storage.update_entry_draft_stage(user.id, "dn_is_return")
                 await query.answer("O'tkazildi.", show_alert=False)
                 await self._prompt_delivery_return_choice(chat_id=chat_id, context=context)
                 return
@@ -730,12 +712,12 @@ class DeliveryFlowMixin:
                 draft["stage"] = "dn_items_menu"
                 self.storage.save_entry_draft(user.id, draft)
                 await query.answer("0 narx bilan qo'shildi.", show_alert=False)
-                await context.bot.send_message(
+                await self._prompt_delivery_items_menu(
                     chat_id=chat_id,
-                    text="Buyum qo'shildi.",
-                    reply_markup=self._delivery_cancel_markup(),
+                    draft=draft,
+                    context=context,
+                    notice="Buyum qo'shildi.",
                 )
-                await self._prompt_delivery_items_menu(chat_id=chat_id, draft=draft, context=context)
                 return
             await query.answer("Bu bosqichda o'tkazib yuborish tugmasi mavjud emas.", show_alert=True)
             return
@@ -752,9 +734,7 @@ class DeliveryFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        if not await self._active_callback_credentials(query, user.id):
             return
         chat_id = query.message.chat_id if query.message else user.id
         draft = {
@@ -767,16 +747,7 @@ class DeliveryFlowMixin:
         await context.bot.send_message(
             chat_id=chat_id,
             text="Tasdiqlash yoki bekor qilish uchun chiqqan mahsulot hujjatini qidiring.",
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [
-                        InlineKeyboardButton(
-                            "🚚 Tasdiqlash oynasini ochish",
-                            switch_inline_query_current_chat=f"{DELIVERY_APPROVE_QUERY_PREFIXES[0]} ",
-                        )
-                    ]
-                ]
-            ),
+            reply_markup=DELIVERY_APPROVE_INLINE_MARKUP,
         )
 
     async def handle_delivery_approve_action(
@@ -789,18 +760,17 @@ class DeliveryFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Chiqqan mahsulot hujjati aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._submit_delivery_note(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -827,18 +797,17 @@ class DeliveryFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Chiqqan mahsulot hujjati aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._cancel_delivery_note(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -865,18 +834,17 @@ class DeliveryFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Chiqqan mahsulot hujjati aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._delete_delivery_note(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -899,8 +867,7 @@ class DeliveryFlowMixin:
         query = update.callback_query
         if not query:
             return
-        docname = (query.data or "").split(":", 1)
-        docname = docname[1] if len(docname) == 2 else ""
+        docname = (query.data or "").partition(":")[2]
         await query.answer("Saqlab qo'yildi.", show_alert=False)
         if query.message:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -956,40 +923,23 @@ class DeliveryFlowMixin:
         *,
         query: str = "",
     ) -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/{quote('Delivery Note', safe='')}"
+        endpoint = DELIVERY_NOTE_RESOURCE
         params = {
-            "fields": json.dumps(
-                [
-                    "name",
-                    "customer",
-                    "posting_date",
-                    "posting_time",
-                    "set_warehouse",
-                    "grand_total",
-                    "docstatus",
-                ]
-            ),
+            "fields": DELIVERY_NOTE_LIST_FIELDS,
             "limit_page_length": str(self.config.delivery_note_limit),
             "order_by": "posting_date desc, posting_time desc",
         }
         if query:
-            params["filters"] = json.dumps([["Delivery Note", "name", "like", f"%{query}%"]])
+            params["filters"] = orjson.dumps([["Delivery Note", "name", "like", f"%{query}%"]]).decode()
 
-        def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers, params=params)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", []
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Chiqqan mahsulot hujjatlari javobini o'qib bo'lmadi.", []
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -998,7 +948,7 @@ class DeliveryFlowMixin:
             return True, None, data  # type: ignore[list-item]
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Chiqqan mahsulot hujjatlari ro'yxatini olishda xatolik: %s", exc)
             return False, str(exc), []
@@ -1011,31 +961,29 @@ class DeliveryFlowMixin:
         limit: int = 25,
         query: str = "",
     ) -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Customer"
+        endpoint = "/api/resource/Customer"
         params = {
-            "fields": json.dumps(["name", "customer_name", "customer_group"]),
+            "fields": CUSTOMER_LIST_FIELDS,
             "limit_page_length": str(limit),
             "order_by": "customer_name asc",
         }
         query = (query or "").strip()
         if query:
-            params["filters"] = json.dumps([["Customer", "customer_name", "like", f"%{query}%"]])
+            params["or_filters"] = orjson.dumps(
+                [
+                    ["Customer", "name", "like", f"%{query}%"],
+                    ["Customer", "customer_name", "like", f"%{query}%"],
+                ]
+            ).decode()
 
-        def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers, params=params)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", []
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Customer javobini o'qib bo'lmadi.", []
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -1044,7 +992,7 @@ class DeliveryFlowMixin:
             return True, None, data  # type: ignore[list-item]
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Customer ro'yxatini olishda xatolik: %s", exc)
             return False, str(exc), []
@@ -1055,23 +1003,16 @@ class DeliveryFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str], Dict[str, Any]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Delivery Note/{quote(docname, safe='')}"
+        endpoint = f"{DELIVERY_NOTE_RESOURCE}/{quote(docname, safe='')}"
 
-        def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", {}
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Chiqqan mahsulot hujjati ma'lumotini o'qib bo'lmadi.", {}
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -1080,7 +1021,7 @@ class DeliveryFlowMixin:
             return True, None, data
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Chiqqan mahsulot hujjati tafsilotlarini olishda xatolik: %s", exc)
             return False, str(exc), {}
@@ -1092,35 +1033,23 @@ class DeliveryFlowMixin:
         *,
         payload: Dict[str, Any],
     ) -> Tuple[bool, Optional[str], Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Delivery Note"
+        endpoint = DELIVERY_NOTE_RESOURCE
 
-        def _request() -> Tuple[bool, Optional[str], Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = (
-                        body.get("message")
-                        or body.get("exception")
-                        or body.get("_server_messages")
-                        or str(body)
-                    )
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], Optional[str]]:
+            headers = self._json_auth_headers(api_key, api_secret)
+            response = await self._http.post(endpoint, headers=headers, content=orjson.dumps(payload), timeout=15)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", None
             try:
-                data = response.json().get("data")
+                data = orjson.loads(response.content).get("data")
                 docname = data.get("name") if isinstance(data, dict) else None
             except Exception:  # noqa: BLE001
                 docname = None
             return True, None, docname
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Delivery Note yaratishda xatolik: %s", exc)
             return False, str(exc), None
@@ -1131,29 +1060,7 @@ class DeliveryFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/method/run_doc_method"
-
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            payload = {"dt": "Delivery Note", "dn": docname, "method": "submit"}
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
-                return False, detail
-            return True, None
-
-        try:
-            return await asyncio.to_thread(_request)
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Delivery Note submitda xatolik: %s", exc)
-            return False, str(exc)
+        return await self._run_doc_method(api_key, api_secret, "Delivery Note", docname, "submit")
 
     async def _cancel_delivery_note(
         self,
@@ -1161,29 +1068,7 @@ class DeliveryFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/method/run_doc_method"
-
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            payload = {"dt": "Delivery Note", "dn": docname, "method": "cancel"}
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
-                return False, detail
-            return True, None
-
-        try:
-            return await asyncio.to_thread(_request)
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Delivery Note cancelda xatolik: %s", exc)
-            return False, str(exc)
+        return await self._run_doc_method(api_key, api_secret, "Delivery Note", docname, "cancel")
 
     async def _delete_delivery_note(
         self,
@@ -1191,28 +1076,7 @@ class DeliveryFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Delivery Note/{quote(docname, safe='')}"
-
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.delete(endpoint, headers=headers, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
-                return False, detail
-            return True, None
-
-        try:
-            return await asyncio.to_thread(_request)
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Delivery Note ni o'chirishda xatolik: %s", exc)
-            return False, str(exc)
+        return await self._delete_document(api_key, api_secret, "Delivery Note", docname)
 
     # ------------------------------------------------------------ formatters
     def _format_delivery_note_message(
@@ -1233,20 +1097,27 @@ class DeliveryFlowMixin:
         )
         total = detail.get("grand_total") or summary.get("grand_total") or "-"
         lines = [
-            f"🚚 Chiqqan mahsulot hujjati: {name}",
-            f"Mijoz: {customer}",
-            f"Sana: {posting_date} {posting_time}",
-            f"Ombor: {warehouse}",
-            f"Jami: {total}",
-            f"Status: {self._docstatus_label(detail.get('docstatus'))}",
+            DELIVERY_NOTE_HEADER_TEMPLATE
+            % (
+                name,
+                customer,
+                posting_date,
+                posting_time,
+                warehouse,
+                total,
+                self._docstatus_label(detail.get("docstatus")),
+            )
         ]
         items = detail.get("items")
         if isinstance(items, list) and items:
             lines.append("")
             max_items = 10
+            append = lines.append
             for item in items[:max_items]:
-                lines.append(
-                    f"• {item.get('item_code')} {item.get('item_name') or ''} — {item.get('qty')} {item.get('uom')} (Narx: {item.get('rate')})"
+                get = item.get
+                append(
+                    DELIVERY_NOTE_ROW_TEMPLATE
+                    % (get("item_code"), get("item_name") or "", get("qty"), get("uom"), get("rate"))
                 )
             if len(items) > max_items:
                 lines.append(f"... va yana {len(items) - max_items} ta buyum")
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Mapping, Optional, Tuple
+
+ITEM_NAME_MARKER = "📦"
+
+ITEM_FIELDS = {"item code": "code", "buyum kodi": "code", "uom": "uom"}
+WAREHOUSE_FIELDS = {"warehouse": "label", "entry warehouse": "label", "code": "code"}
+SUPPLIER_FIELDS = {"supplier": "label", "yetkazib beruvchi": "label", "code": "code", "kod": "code"}
+CUSTOMER_FIELDS = {"customer": "label", "code": "code"}
+SKIP_VALUES = frozenset(
+    {
+        "skip",
+        "-",
+        "yo'q",
+        "yoq",
+        "otkaz",
+        "o'tkaz",
+        "otkazib yuborish",
+        "o'tkazib yuborish",
+    }
+)
+YES_VALUES = frozenset({"ha", "ha.", "yes", "y", "true", "1"})
+NO_VALUES = frozenset({"yo'q", "yoq", "yo'q.", "no", "n", "false", "0"})
+DATE_RE = re.compile(r"([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})")
+TIME_RE = re.compile(r"([0-9]{1,2}):([0-9]{1,2})")
+
+
+def parse_inline_fields(
+    text: str,
+    fields: Mapping[str, str],
+    markers: Tuple[str, ...] = (),
+) -> Optional[Dict[str, str]]:
+    search = _marker_pattern(markers).search if markers else None
+    found = search is None
+    data: Dict[str, str] = {}
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if not found and search(line):
+            found = True
+        if line.startswith(ITEM_NAME_MARKER):
+            data["name"] = line.lstrip(ITEM_NAME_MARKER).strip()
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        target = fields.get(key.lower())
+        if target:
+            data[target] = value.strip()
+    return data if found else None
+
+
+def find_token_value(text: str, prefix: str) -> Optional[str]:
+    marker = f"{prefix}:"
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if line.startswith(marker):
+            return line[len(marker):].strip() or None
+    return None
+
+
+@lru_cache(maxsize=16)
+def _marker_pattern(markers: Tuple[str, ...]) -> "re.Pattern[str]":
+    return re.compile("|".join(map(re.escape, markers)), re.IGNORECASE)
+
+
+def parse_item_inline(text: str, markers: Tuple[str, ...]) -> Optional[Dict[str, str]]:
+    data = parse_inline_fields(text, ITEM_FIELDS, markers)
+    if data is None:
+        return None
+    code = data.get("code")
+    if not code:
+        return None
+    return {"code": code, "name": data.get("name") or code, "uom": data.get("uom") or "-"}
+
+
+def parse_labelled_inline(
+    text: str,
+    markers: Tuple[str, ...],
+    fields: Mapping[str, str],
+) -> Optional[Dict[str, str]]:
+    data = parse_inline_fields(text, fields, markers)
+    if data is None:
+        return None
+    label = data.get("label")
+    code = data.get("code") or label
+    if not code:
+        return None
+    return {"code": code, "label": label or code}
+
+
+def parse_number(text: str) -> Optional[float]:
+    value = text.strip()
+    if value.isdecimal():
+        return float(value)
+    if "," in value:
+        value = value.replace(",", ".")
+    digits = value[1:] if value[:1] in "+-" else value
+    whole, _, fraction = digits.partition(".")
+    if not (whole or fraction):
+        return None
+    if (whole and not whole.isdecimal()) or (fraction and not fraction.isdecimal()):
+        return None
+    return float(value)
+
+
+def parse_date(text: str) -> Optional[str]:
+    match = DATE_RE.fullmatch(text.strip())
+    if not match:
+        return None
+    try:
+        return date(int(match[1]), int(match[2]), int(match[3])).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_time(text: str) -> Optional[str]:
+    match = TIME_RE.fullmatch(text.strip())
+    if not match:
+        return None
+    hour, minute = int(match[1]), int(match[2])
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
@@ -1,13 +1,13 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 from datetime import datetime
 from typing import Any, Dict, Optional, Tuple
 
 from urllib.parse import quote
-import requests
+
+import orjson
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -18,6 +18,19 @@ from telegram import (
 from telegram.ext import ContextTypes
 from telegram.constants import ChatType
 
+from .parsing import (
+    SUPPLIER_FIELDS,
+    NO_VALUES,
+    SKIP_VALUES,
+    YES_VALUES,
+    find_token_value,
+    parse_date,
+    parse_item_inline,
+    parse_labelled_inline,
+    parse_number,
+    parse_time,
+)
+
 logger = logging.getLogger(__name__)
 
 PURCHASE_TRIGGER = "purchase"
@@ -31,6 +44,60 @@ PURCHASE_DELETE_PREFIX = "purchase-delete"
 PURCHASE_CONFIRM_CALLBACK = "purchase:confirm"
 PURCHASE_APPROVE_QUERY_PREFIXES = ("purchaseapprove", "prapprove")
 PURCHASE_DISMISS_PREFIX = "purchase-dismiss"
+PURCHASE_RECEIPT_RESOURCE = "/api/resource/" + quote("Purchase Receipt", safe="")
+PURCHASE_RECEIPT_LIST_FIELDS = orjson.dumps(
+    [
+        "name",
+        "supplier",
+        "posting_date",
+        "posting_time",
+        "set_warehouse",
+        "grand_total",
+        "docstatus",
+    ]
+).decode()
+
+PURCHASE_CANCEL_BUTTON = InlineKeyboardButton(
+    "❌ Jarayonni bekor qilish", callback_data=f"{PURCHASE_CREATE_PREFIX}:cancel"
+)
+PURCHASE_SKIP_BUTTON = InlineKeyboardButton(
+    "⏭ O'tkazib yuborish", callback_data=f"{PURCHASE_CREATE_PREFIX}:skip"
+)
+PURCHASE_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Ko'rish", switch_inline_query_current_chat=PURCHASE_TRIGGER)],
+        [InlineKeyboardButton("➕ Yangi rasmiylashtirish", callback_data=PURCHASE_CALLBACK_CREATE)],
+        [InlineKeyboardButton("✔️ Tasdiqlash", callback_data=PURCHASE_CONFIRM_CALLBACK)],
+    ]
+)
+PURCHASE_CANCEL_MARKUP = InlineKeyboardMarkup([[PURCHASE_CANCEL_BUTTON]])
+PURCHASE_SKIP_MARKUP = InlineKeyboardMarkup([[PURCHASE_SKIP_BUTTON], [PURCHASE_CANCEL_BUTTON]])
+PURCHASE_YES_NO_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("Ha", callback_data=f"{PURCHASE_CREATE_PREFIX}:yn:yes"),
+            InlineKeyboardButton("Yo'q", callback_data=f"{PURCHASE_CREATE_PREFIX}:yn:no"),
+        ],
+        [PURCHASE_CANCEL_BUTTON],
+    ]
+)
+PURCHASE_ITEMS_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("📦 Buyum qidirish", switch_inline_query_current_chat=f"{PURCHASE_ITEM_QUERY_PREFIX} ")],
+        [InlineKeyboardButton("✅ Kirimni rasmiylashtirishni yakunlash", callback_data=f"{PURCHASE_CREATE_PREFIX}:finish")],
+        [PURCHASE_CANCEL_BUTTON],
+    ]
+)
+PURCHASE_APPROVE_INLINE_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton(
+                "🧾 Tasdiqlash oynasini ochish",
+                switch_inline_query_current_chat=f"{PURCHASE_APPROVE_QUERY_PREFIXES[0]} ",
+            )
+        ]
+    ]
+)
 
 
 class PurchaseFlowMixin:
@@ -38,47 +105,22 @@ class PurchaseFlowMixin:
 
     # ------------------------------------------------------------------ menus
     def _purchase_markup(self) -> InlineKeyboardMarkup:
-        view_button = InlineKeyboardButton(
-            "Ko'rish",
-            switch_inline_query_current_chat=PURCHASE_TRIGGER,
-        )
-        create_button = InlineKeyboardButton(
-            "➕ Yangi rasmiylashtirish", callback_data=PURCHASE_CALLBACK_CREATE
-        )
-        confirm_button = InlineKeyboardButton(
-            "✔️ Tasdiqlash", callback_data=PURCHASE_CONFIRM_CALLBACK
-        )
-        return InlineKeyboardMarkup([[view_button], [create_button], [confirm_button]])
+        return PURCHASE_MARKUP
 
     def _purchase_cancel_button(self) -> InlineKeyboardButton:
-        return InlineKeyboardButton(
-            "❌ Jarayonni bekor qilish", callback_data=f"{PURCHASE_CREATE_PREFIX}:cancel"
-        )
+        return PURCHASE_CANCEL_BUTTON
 
     def _purchase_cancel_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup([[self._purchase_cancel_button()]])
+        return PURCHASE_CANCEL_MARKUP
 
     def _skip_inline_button(self) -> InlineKeyboardButton:
-        return InlineKeyboardButton("⏭ O'tkazib yuborish", callback_data=f"{PURCHASE_CREATE_PREFIX}:skip")
+        return PURCHASE_SKIP_BUTTON
 
     def _skip_inline_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup(
-            [
-                [self._skip_inline_button()],
-                [self._purchase_cancel_button()],
-            ]
-        )
+        return PURCHASE_SKIP_MARKUP
 
     def _yes_no_inline_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup(
-            [
-                [
-                    InlineKeyboardButton("Ha", callback_data=f"{PURCHASE_CREATE_PREFIX}:yn:yes"),
-                    InlineKeyboardButton("Yo'q", callback_data=f"{PURCHASE_CREATE_PREFIX}:yn:no"),
-                ],
-                [self._purchase_cancel_button()],
-            ]
-        )
+        return PURCHASE_YES_NO_MARKUP
 
     # ------------------------------------------------------------ prompts/flow
     async def _start_purchase_receipt_creation(
@@ -94,8 +136,8 @@ class PurchaseFlowMixin:
             "stage": "pr_supplier",
             "chat_id": chat_id,
             "series": self.config.purchase_receipt_series_template,
-            "posting_date": now.strftime("%Y-%m-%d"),
-            "posting_time": now.strftime("%H:%M"),
+            "posting_date": now.date().isoformat(),
+            "posting_time": f"{now.hour:02d}:{now.minute:02d}",
             "supplier_delivery_note": "",
             "apply_putaway_rule": False,
             "is_return": False,
@@ -233,23 +275,7 @@ class PurchaseFlowMixin:
         )
 
     def _purchase_items_markup(self) -> InlineKeyboardMarkup:
-        return InlineKeyboardMarkup(
-            [
-                [
-                    InlineKeyboardButton(
-                        "📦 Buyum qidirish",
-                        switch_inline_query_current_chat=f"{PURCHASE_ITEM_QUERY_PREFIX} ",
-                    )
-                ],
-                [
-                    InlineKeyboardButton(
-                        "✅ Kirimni rasmiylashtirishni yakunlash",
-                        callback_data=f"{PURCHASE_CREATE_PREFIX}:finish",
-                    )
-                ],
-                [self._purchase_cancel_button()],
-            ]
-        )
+        return PURCHASE_ITEMS_MARKUP
 
     def _purchase_action_buttons(self, detail: Dict[str, Any]) -> Optional[InlineKeyboardMarkup]:
         docname = detail.get("name")
@@ -287,6 +313,7 @@ class PurchaseFlowMixin:
         chat_id: int,
         draft: Dict[str, Any],
         context: ContextTypes.DEFAULT_TYPE,
+        notice: Optional[str] = None,
     ) -> None:
         items = draft.get("items") or []
         if items:
@@ -298,6 +325,8 @@ class PurchaseFlowMixin:
             summary = "\n".join(lines)
         else:
             summary = "Hozircha item qo'shilmagan."
+        if notice:
+            summary = f"{notice}\n\n{summary}"
         await context.bot.send_message(
             chat_id=chat_id,
             text=summary + "\nYangi item qo'shish yoki yakunlash uchun pastdagi tugmalardan foydalaning.",
@@ -307,56 +336,20 @@ class PurchaseFlowMixin:
     # ---------------------------------------------------------------- parsing
     @staticmethod
     def _parse_supplier_inline(text: str) -> Optional[Dict[str, str]]:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines or not any(
-            "#supplier" in line.lower()
-            or "supplier:" in line.lower()
-            or "yetkazib beruvchi" in line.lower()
-            for line in lines
-        ):
-            return None
-        code = None
-        label = None
-        for line in lines:
-            lowered = line.lower()
-            if lowered.startswith("supplier:") or lowered.startswith("yetkazib beruvchi:"):
-                label = line.split(":", 1)[1].strip()
-            if lowered.startswith("code:") or lowered.startswith("kod:"):
-                code = line.split(":", 1)[1].strip()
-        if not code:
-            code = label
-        if not code:
-            return None
-        return {"code": code, "label": label or code}
+        return parse_labelled_inline(
+            text, ("#supplier", "supplier:", "yetkazib beruvchi"), SUPPLIER_FIELDS
+        )
 
     @staticmethod
     def _parse_pr_item_inline(text: str) -> Optional[Dict[str, str]]:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines or not any("#pritem" in line.lower() for line in lines):
-            return None
-        code = None
-        name = None
-        uom = None
-        for line in lines:
-            if line.startswith("📦"):
-                name = line.lstrip("📦").strip()
-            lowered = line.lower()
-            if lowered.startswith("item code:") or lowered.startswith("buyum kodi:"):
-                code = line.split(":", 1)[1].strip()
-            if lowered.startswith("uom:"):
-                uom = line.split(":", 1)[1].strip()
-        if not code:
-            return None
-        return {"code": code, "name": name or code, "uom": uom or "-"}
+        return parse_item_inline(text, ("#pritem",))
 
     @staticmethod
     def _parse_yes_no(value: str) -> Optional[bool]:
         normalized = (value or "").strip().lower()
-        positives = {"ha", "ha.", "yes", "y", "true", "1"}
-        negatives = {"yo'q", "yoq", "yo'q.", "no", "n", "false", "0"}
-        if normalized in positives:
+        if normalized in YES_VALUES:
             return True
-        if normalized in negatives:
+        if normalized in NO_VALUES:
             return False
         return None
 
@@ -376,16 +369,6 @@ class PurchaseFlowMixin:
         stage = draft.get("stage")
         chat_id = draft.get("chat_id", message.chat_id)
         normalized = text.strip().lower()
-        skip_values = {
-            "skip",
-            "-",
-            "yo'q",
-            "yoq",
-            "otkaz",
-            "o'tkaz",
-            "otkazib yuborish",
-            "o'tkazib yuborish",
-        }
 
         if stage == "pr_supplier":
             data = self._parse_supplier_inline(text)
@@ -401,7 +384,7 @@ class PurchaseFlowMixin:
             return True
 
         if stage == "pr_supplier_note":
-            draft["supplier_delivery_note"] = "" if normalized in skip_values else text
+            draft["supplier_delivery_note"] = "" if normalized in SKIP_VALUES else text
             draft["stage"] = "pr_date"
             self.storage.save_entry_draft(user_id, draft)
             await self._prompt_purchase_posting_date(
@@ -412,13 +395,12 @@ class PurchaseFlowMixin:
             return True
 
         if stage == "pr_date":
-            if normalized not in skip_values:
-                try:
-                    parsed = datetime.strptime(text.strip(), "%Y-%m-%d")
-                    draft["posting_date"] = parsed.strftime("%Y-%m-%d")
-                except ValueError:
+            if normalized not in SKIP_VALUES:
+                posting_date = parse_date(text)
+                if not posting_date:
                     await message.reply_text("Sana formatini YYYY-MM-DD ko'rinishida yuboring.")
                     return True
+                draft["posting_date"] = posting_date
             draft["stage"] = "pr_time"
             self.storage.save_entry_draft(user_id, draft)
             await self._prompt_purchase_posting_time(
@@ -429,13 +411,12 @@ class PurchaseFlowMixin:
             return True
 
         if stage == "pr_time":
-            if normalized not in skip_values:
-                try:
-                    parsed = datetime.strptime(text.strip(), "%H:%M")
-                    draft["posting_time"] = parsed.strftime("%H:%M")
-                except ValueError:
+            if normalized not in SKIP_VALUES:
+                posting_time = parse_time(text)
+                if not posting_time:
                     await message.reply_text("Vaqt formatini HH:MM ko'rinishida yuboring.")
                     return True
+                draft["posting_time"] = posting_time
             draft["stage"] = "pr_putaway"
             self.storage.save_entry_draft(user_id, draft)
             await self._prompt_purchase_putaway_choice(chat_id=chat_id, context=context)
@@ -477,7 +458,7 @@ class PurchaseFlowMixin:
             return True
 
         if stage == "pr_rejected_wh":
-            if normalized in skip_values and not from_inline_result:
+            if normalized in SKIP_VALUES and not from_inline_result:
                 draft["rejected_warehouse"] = None
             else:
                 data = self._parse_warehouse_inline(text)
@@ -486,7 +467,7 @@ class PurchaseFlowMixin:
                     await message.reply_text(f"{data.get('label')} rejected ombor sifatida tanlandi.")
                 elif from_inline_result:
                     return True
-                elif normalized not in skip_values:
+                elif normalized not in SKIP_VALUES:
                     await message.reply_text("Inline oynadan ombor tanlang yoki \"o'tkazib yuborish\" deb yozing.")
                     return True
                 else:
@@ -512,10 +493,8 @@ class PurchaseFlowMixin:
             return True
 
         if stage == "pr_item_qty":
-            normalized_qty = text.replace(",", ".")
-            try:
-                qty = float(normalized_qty)
-            except ValueError:
+            qty = parse_number(text)
+            if qty is None:
                 await message.reply_text("Miqdor noto'g'ri. Masalan: 25")
                 return True
             if qty <= 0:
@@ -533,13 +512,11 @@ class PurchaseFlowMixin:
             return True
 
         if stage == "pr_item_rejected_qty":
-            if normalized in skip_values:
+            if normalized in SKIP_VALUES:
                 rejected = 0.0
             else:
-                normalized_qty = text.replace(",", ".")
-                try:
-                    rejected = float(normalized_qty)
-                except ValueError:
+                rejected = parse_number(text)
+                if rejected is None:
                     await message.reply_text("Miqdor noto'g'ri. Masalan: 0 yoki 1.5")
                     return True
                 if rejected < 0:
@@ -557,10 +534,8 @@ class PurchaseFlowMixin:
             return True
 
         if stage == "pr_item_rate":
-            normalized_rate = text.replace(",", ".")
-            try:
-                rate = float(normalized_rate)
-            except ValueError:
+            rate = parse_number(text)
+            if rate is None:
                 await message.reply_text("Narx noto'g'ri. Masalan: 12000")
                 return True
             if rate < 0:
@@ -584,11 +559,12 @@ class PurchaseFlowMixin:
             draft["current_item"] = None
             draft["stage"] = "pr_items_menu"
             self.storage.save_entry_draft(user_id, draft)
-            await message.reply_text(
-                f"{item_entry.get('name')} qo'shildi.",
-                reply_markup=self._purchase_cancel_markup(),
+            await self._prompt_purchase_items_menu(
+                chat_id=chat_id,
+                draft=draft,
+                context=context,
+                notice=f"{item_entry.get('name')} qo'shildi.",
             )
-            await self._prompt_purchase_items_menu(chat_id=chat_id, draft=draft, context=context)
             return True
 
         return False
@@ -601,12 +577,14 @@ class PurchaseFlowMixin:
         api_key: str,
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
+        banner: Optional[asyncio.Task] = None,
     ) -> None:
         supplier = draft.get("supplier")
         items = draft.get("items") or []
         accepted_warehouse = draft.get("accepted_warehouse")
         chat_id = draft.get("chat_id", user_id)
         if not supplier or not accepted_warehouse or not items:
+            await self._settle(banner)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="Ma'lumotlar yetarli emas. Yetkazib beruvchi, ombor va kamida 1 ta buyumni tanlang.",
@@ -652,6 +630,7 @@ class PurchaseFlowMixin:
             api_secret,
             payload=payload,
         )
+        await self._settle(banner)
         if success:
             self.storage.delete_entry_draft(user_id)
             detail_success = False
@@ -663,8 +642,7 @@ class PurchaseFlowMixin:
                     docname,
                 )
             if detail_success:
-                summary = detail.copy()
-                text_message = self._format_purchase_receipt_message(summary, detail)
+                text_message = self._format_purchase_receipt_message(detail, detail)
                 markup = self._purchase_action_buttons(detail)
                 await context.bot.send_message(
                     chat_id=chat_id,
@@ -702,23 +680,17 @@ class PurchaseFlowMixin:
         api_secret: str,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> bool:
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        if not lines:
-            return False
-        token_line = next((line for line in lines if line.startswith(f"{PURCHASE_APPROVE_PREFIX}:")), None)
-        if not token_line:
-            return False
-        _, docname = token_line.split(":", 1)
-        docname = docname.strip()
+        docname = find_token_value(text, PURCHASE_APPROVE_PREFIX)
         if not docname:
             return False
-        success, error_detail, detail = await self._fetch_purchase_receipt_detail(api_key, api_secret, docname)
+        success, error_detail, detail = await self._detail_task(
+            self._fetch_purchase_receipt_detail, api_key, api_secret, docname
+        )
         if not success:
             fallback = error_detail or "Ma'lumot topilmadi."
             await message.reply_text(f"Tasdiqlashda xatolik:\n{fallback}")
             return True
-        summary = detail.copy()
-        text_message = self._format_purchase_receipt_message(summary, detail)
+        text_message = self._format_purchase_receipt_message(detail, detail)
         markup = self._purchase_action_buttons(detail)
         await message.reply_text(text_message, reply_markup=markup)
         self.storage.delete_entry_draft(user_id)
@@ -731,12 +703,11 @@ class PurchaseFlowMixin:
         message = update.message
         if not chat or not user or not message or chat.type != ChatType.PRIVATE:
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
+        credentials = self._active_credentials(user.id)
+        if credentials is None:
             await message.reply_text("Avval /start orqali API kalit va secret ni tasdiqlang.")
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
         await self._send_purchase_preview(
             chat_id=chat.id,
             api_key=api_key,
@@ -758,12 +729,10 @@ class PurchaseFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key")
-        api_secret = creds.get("api_secret")
+        api_key, api_secret = credentials
         if not api_key or not api_secret:
             await query.answer("API kalitlari topilmadi.", show_alert=True)
             return
@@ -783,9 +752,7 @@ class PurchaseFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        parts = (query.data or "").split(":", 2)
-        action = parts[1] if len(parts) > 1 else ""
-        value = parts[2] if len(parts) > 2 else ""
+        action, _, value = (query.data or "").partition(":")[2].partition(":")
         draft = self.storage.get_entry_draft(user.id)
         if not draft:
             await query.answer("Kirim hujjati jarayoni topilmadi.", show_alert=True)
@@ -795,12 +762,10 @@ class PurchaseFlowMixin:
             await query.answer("Kirim hujjati jarayoni topilmadi.", show_alert=True)
             return
         chat_id = draft.get("chat_id") or (query.message.chat_id if query.message else user.id)
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
-        api_key = creds.get("api_key") or ""
-        api_secret = creds.get("api_secret") or ""
+        api_key, api_secret = credentials
 
         if action == "finish":
             if draft.get("stage") not in {"pr_items_menu", "pr_item_rate"}:
@@ -818,13 +783,15 @@ class PurchaseFlowMixin:
             draft["stage"] = "pr_submitting"
             self.storage.save_entry_draft(user.id, draft)
             await query.answer("Yaratilmoqda…", show_alert=False)
-            await context.bot.send_message(chat_id=chat_id, text="⏳ Kirim hujjati yaratilmoqda...")
             await self._finalise_purchase_receipt_creation(
                 user_id=user.id,
                 draft=draft,
                 api_key=api_key,
                 api_secret=api_secret,
                 context=context,
+                banner=self._spawn(
+                    context.bot.send_message(chat_id=chat_id, text="⏳ Kirim hujjati yaratilmoqda...")
+                ),
             )
             return
 
@@ -873,7 +840,7 @@ class PurchaseFlowMixin:
                 return
             if stage == "pr_date":
                 draft["stage"] = "pr_time"
-                self.storage.save_entry_draft(user.id, draft)
+                self.storage.update_entry_draft_stage(user.id, "pr_time")
                 await query.answer("O'tkazildi.", show_alert=False)
                 await self._prompt_purchase_posting_time(
                     chat_id=chat_id,
@@ -883,7 +850,7 @@ class PurchaseFlowMixin:
                 return
             if stage == "pr_time":
                 draft["stage"] = "pr_putaway"
-                self.storage.save_entry_draft(user.id, draft)
+                self.storage.update_entry_draft_stage(user.id, "pr_putaway")
                 await query.answer("O'tkazildi.", show_alert=False)
                 await self._prompt_purchase_putaway_choice(chat_id=chat_id, context=context)
                 return
@@ -922,9 +889,7 @@ class PurchaseFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        if not await self._active_callback_credentials(query, user.id):
             return
         chat_id = query.message.chat_id if query.message else user.id
         draft = {
@@ -937,16 +902,7 @@ class PurchaseFlowMixin:
         await context.bot.send_message(
             chat_id=chat_id,
             text="Tasdiqlash yoki bekor qilish uchun quyidagi oynani ochib kirim hujjatini qidiring.",
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [
-                        InlineKeyboardButton(
-                            "🧾 Tasdiqlash oynasini ochish",
-                            switch_inline_query_current_chat=f"{PURCHASE_APPROVE_QUERY_PREFIXES[0]} ",
-                        )
-                    ]
-                ]
-            ),
+            reply_markup=PURCHASE_APPROVE_INLINE_MARKUP,
         )
 
     async def handle_purchase_approve_action(
@@ -959,18 +915,17 @@ class PurchaseFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Kirim hujjati aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._submit_purchase_receipt(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -997,18 +952,17 @@ class PurchaseFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Kirim hujjati aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._cancel_purchase_receipt(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -1035,18 +989,17 @@ class PurchaseFlowMixin:
         if not user:
             await query.answer("Foydalanuvchi aniqlanmadi.", show_alert=True)
             return
-        docname = (query.data or "").split(":", 1)[1:]
-        docname = docname[0] if docname else ""
+        docname = (query.data or "").partition(":")[2]
         if not docname:
             await query.answer("Kirim hujjati aniqlanmadi.", show_alert=True)
             return
-        creds = self.storage.get_credentials(user.id)
-        if not creds or creds.get("status") != "active":
-            await query.answer("Avval /start orqali API kalitlarini sozlang.", show_alert=True)
+        credentials = await self._active_callback_credentials(query, user.id)
+        if not credentials:
             return
+        api_key, api_secret = credentials
         success, error_detail = await self._delete_purchase_receipt(
-            creds.get("api_key") or "",
-            creds.get("api_secret") or "",
+            api_key,
+            api_secret,
             docname,
         )
         if success:
@@ -1069,8 +1022,7 @@ class PurchaseFlowMixin:
         query = update.callback_query
         if not query:
             return
-        docname = (query.data or "").split(":", 1)
-        docname = docname[1] if len(docname) == 2 else ""
+        docname = (query.data or "").partition(":")[2]
         await query.answer("Saqlanib turibdi.", show_alert=False)
         if query.message:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -1125,40 +1077,23 @@ class PurchaseFlowMixin:
         *,
         query: str = "",
     ) -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/{quote('Purchase Receipt', safe='')}"
+        endpoint = PURCHASE_RECEIPT_RESOURCE
         params = {
-            "fields": json.dumps(
-                [
-                    "name",
-                    "supplier",
-                    "posting_date",
-                    "posting_time",
-                    "set_warehouse",
-                    "grand_total",
-                    "docstatus",
-                ]
-            ),
+            "fields": PURCHASE_RECEIPT_LIST_FIELDS,
             "limit_page_length": str(self.config.purchase_receipt_limit),
             "order_by": "posting_date desc, posting_time desc",
         }
         if query:
-            params["filters"] = json.dumps([["Purchase Receipt", "name", "like", f"%{query}%"]])
+            params["filters"] = orjson.dumps([["Purchase Receipt", "name", "like", f"%{query}%"]]).decode()
 
-        def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], list[Dict[str, Any]]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers, params=params)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", []
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Kirim hujjatlari javobini o'qib bo'lmadi.", []
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -1167,7 +1102,7 @@ class PurchaseFlowMixin:
             return True, None, data  # type: ignore[list-item]
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Kirim hujjatlari ro'yxatini olishda xatolik: %s", exc)
             return False, str(exc), []
@@ -1178,23 +1113,16 @@ class PurchaseFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str], Dict[str, Any]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Purchase Receipt/{quote(docname, safe='')}"
+        endpoint = f"{PURCHASE_RECEIPT_RESOURCE}/{quote(docname, safe='')}"
 
-        def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.get(endpoint, headers=headers, timeout=10)
-            if response.status_code >= 400:
-                try:
-                    payload = response.json()
-                    detail = payload.get("message") or payload.get("exception") or str(payload)
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], Dict[str, Any]]:
+            headers = self._auth_headers(api_key, api_secret)
+            response = await self._http.get(endpoint, headers=headers)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", {}
             try:
-                payload = response.json()
+                payload = orjson.loads(response.content)
             except ValueError:
                 return False, "Kirim hujjati ma'lumotini o'qib bo'lmadi.", {}
             data = payload.get("data") if isinstance(payload, dict) else payload
@@ -1203,7 +1131,7 @@ class PurchaseFlowMixin:
             return True, None, data
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Kirim hujjati tafsilotlarini olishda xatolik: %s", exc)
             return False, str(exc), {}
@@ -1215,35 +1143,23 @@ class PurchaseFlowMixin:
         *,
         payload: Dict[str, Any],
     ) -> Tuple[bool, Optional[str], Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Purchase Receipt"
+        endpoint = PURCHASE_RECEIPT_RESOURCE
 
-        def _request() -> Tuple[bool, Optional[str], Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = (
-                        body.get("message")
-                        or body.get("exception")
-                        or body.get("_server_messages")
-                        or str(body)
-                    )
-                except ValueError:
-                    detail = response.text
+        async def _request() -> Tuple[bool, Optional[str], Optional[str]]:
+            headers = self._json_auth_headers(api_key, api_secret)
+            response = await self._http.post(endpoint, headers=headers, content=orjson.dumps(payload), timeout=15)
+            if response.is_error:
+                detail = self._erp_error_detail(response)
                 return False, f"HTTP {response.status_code}: {detail}", None
             try:
-                data = response.json().get("data")
+                data = orjson.loads(response.content).get("data")
                 docname = data.get("name") if isinstance(data, dict) else None
             except Exception:  # noqa: BLE001
                 docname = None
             return True, None, docname
 
         try:
-            return await asyncio.to_thread(_request)
+            return await self._erp_call(_request)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Purchase Receipt yaratishda xatolik: %s", exc)
             return False, str(exc), None
@@ -1254,29 +1170,7 @@ class PurchaseFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/method/run_doc_method"
-
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            payload = {"dt": "Purchase Receipt", "dn": docname, "method": "submit"}
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
-                return False, detail
-            return True, None
-
-        try:
-            return await asyncio.to_thread(_request)
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Purchase Receipt submitda xatolik: %s", exc)
-            return False, str(exc)
+        return await self._run_doc_method(api_key, api_secret, "Purchase Receipt", docname, "submit")
 
     async def _cancel_purchase_receipt(
         self,
@@ -1284,29 +1178,7 @@ class PurchaseFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/method/run_doc_method"
-
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            payload = {"dt": "Purchase Receipt", "dn": docname, "method": "cancel"}
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
-                return False, detail
-            return True, None
-
-        try:
-            return await asyncio.to_thread(_request)
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Purchase Receipt cancelda xatolik: %s", exc)
-            return False, str(exc)
+        return await self._run_doc_method(api_key, api_secret, "Purchase Receipt", docname, "cancel")
 
     async def _delete_purchase_receipt(
         self,
@@ -1314,25 +1186,4 @@ class PurchaseFlowMixin:
         api_secret: str,
         docname: str,
     ) -> Tuple[bool, Optional[str]]:
-        endpoint = f"{self.config.frappe_base_url}/api/resource/Purchase Receipt/{quote(docname, safe='')}"
-
-        def _request() -> Tuple[bool, Optional[str]]:
-            headers = {
-                "Authorization": f"token {api_key}:{api_secret}",
-                "Accept": "application/json",
-            }
-            response = requests.delete(endpoint, headers=headers, timeout=15)
-            if response.status_code >= 400:
-                try:
-                    body = response.json()
-                    detail = body.get("message") or body.get("exception") or str(body)
-                except ValueError:
-                    detail = response.text
-                return False, detail
-            return True, None
-
-        try:
-            return await asyncio.to_thread(_request)
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Purchase Receipt ni o'chirishda xatolik: %s", exc)
-            return False, str(exc)
+        return await self._delete_document(api_key, api_secret, "Purchase Receipt", docname)
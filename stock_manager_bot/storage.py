@@ -2,15 +2,21 @@ from __future__ import annotations
 
 import sqlite3
 import threading
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, Iterable, Optional
-import json
+from typing import Any, Dict, Iterable, Optional, Tuple
 
+import orjson
 
-def _utcnow() -> str:
-    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+CREDENTIALS_CACHE_SIZE = 10_000
+DRAFT_REFRESH_SECONDS = 60.0
+
+
+def _utcnow(offset: timedelta = timedelta()) -> str:
+    return (datetime.utcnow() - offset).replace(microsecond=0).isoformat() + "Z"
 
 
 class StockStorage:
@@ -21,12 +27,16 @@ class StockStorage:
         if self.db_path.parent and not self.db_path.parent.exists():
             self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self._lock = threading.RLock()
+        self._credentials_cache: OrderedDict[int, Optional[Dict[str, Optional[str]]]] = OrderedDict()
+        self._known_profiles: OrderedDict[int, Tuple[Optional[str], ...]] = OrderedDict()
+        self._saved_drafts: OrderedDict[int, Tuple[bytes, float]] = OrderedDict()
         self._initialise()
 
     @contextmanager
     def _connection(self) -> Iterable[sqlite3.Connection]:
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous = NORMAL")
         try:
             yield conn
             conn.commit()
@@ -38,6 +48,7 @@ class StockStorage:
             conn.executescript(
                 """
                 PRAGMA foreign_keys = ON;
+                PRAGMA journal_mode = WAL;
 
                 CREATE TABLE IF NOT EXISTS users (
                     telegram_id INTEGER PRIMARY KEY,
@@ -67,6 +78,106 @@ class StockStorage:
             )
 
     # --------------------------------------------- users / credentials
+    @staticmethod
+    def _upsert_user(
+        conn: sqlite3.Connection,
+        telegram_id: int,
+        *,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+    ) -> None:
+        now = _utcnow()
+        conn.execute(
+            """
+            INSERT INTO users (telegram_id, username, first_name, last_name, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE
+            SET username = excluded.username,
+                first_name = excluded.first_name,
+                last_name = excluded.last_name,
+                updated_at = excluded.updated_at
+            """,
+            (telegram_id, username, first_name, last_name, now, now),
+        )
+
+    def _touch_user(
+        self,
+        conn: sqlite3.Connection,
+        telegram_id: int,
+        *,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+    ) -> None:
+        profile = (username, first_name, last_name)
+        known = self._known_profiles
+        if known.get(telegram_id) == profile:
+            known.move_to_end(telegram_id)
+            return
+        self._upsert_user(
+            conn,
+            telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+        )
+        known[telegram_id] = profile
+        if len(known) > CREDENTIALS_CACHE_SIZE:
+            known.popitem(last=False)
+
+    @staticmethod
+    def _select_credentials(
+        conn: sqlite3.Connection, telegram_id: int
+    ) -> Optional[Dict[str, Optional[str]]]:
+        row = conn.execute(
+            """
+            SELECT telegram_id, api_key, api_secret, status
+            FROM credentials
+            WHERE telegram_id = ?
+            """,
+            (telegram_id,),
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            "telegram_id": row["telegram_id"],
+            "api_key": row["api_key"],
+            "api_secret": row["api_secret"],
+            "status": row["status"],
+        }
+
+    def _cached_credentials(
+        self, conn: Optional[sqlite3.Connection], telegram_id: int
+    ) -> Optional[Dict[str, Optional[str]]]:
+        cache = self._credentials_cache
+        if telegram_id in cache:
+            cache.move_to_end(telegram_id)
+            creds = cache[telegram_id]
+        else:
+            if conn is None:
+                with self._connection() as fresh:
+                    creds = self._select_credentials(fresh, telegram_id)
+            else:
+                creds = self._select_credentials(conn, telegram_id)
+            cache[telegram_id] = creds
+            if len(cache) > CREDENTIALS_CACHE_SIZE:
+                cache.popitem(last=False)
+        return dict(creds) if creds else None
+
+    @staticmethod
+    def _select_entry_draft(conn: sqlite3.Connection, telegram_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT payload FROM entry_drafts WHERE telegram_id = ?",
+            (telegram_id,),
+        ).fetchone()
+        if not row:
+            return None
+        try:
+            return orjson.loads(row["payload"])
+        except orjson.JSONDecodeError:
+            return None
+
     def record_user(
         self,
         telegram_id: int,
@@ -75,52 +186,59 @@ class StockStorage:
         first_name: Optional[str],
         last_name: Optional[str],
     ) -> None:
-        now = _utcnow()
         with self._lock, self._connection() as conn:
-            row = conn.execute(
-                "SELECT telegram_id FROM users WHERE telegram_id = ?",
-                (telegram_id,),
-            ).fetchone()
-            if row:
-                conn.execute(
-                    """
-                    UPDATE users
-                    SET username = ?, first_name = ?, last_name = ?, updated_at = ?
-                    WHERE telegram_id = ?
-                    """,
-                    (username, first_name, last_name, now, telegram_id),
-                )
-            else:
-                conn.execute(
-                    """
-                    INSERT INTO users (telegram_id, username, first_name, last_name, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (telegram_id, username, first_name, last_name, now, now),
-                )
+            self._touch_user(
+                conn,
+                telegram_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+            )
 
-    def get_credentials(self, telegram_id: int) -> Optional[Dict[str, Optional[str]]]:
+    def record_user_and_get_credentials(
+        self,
+        telegram_id: int,
+        *,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+    ) -> Optional[Dict[str, Optional[str]]]:
         with self._lock, self._connection() as conn:
-            row = conn.execute(
-                """
-                SELECT telegram_id, api_key, api_secret, status
-                FROM credentials
-                WHERE telegram_id = ?
-                """,
-                (telegram_id,),
-            ).fetchone()
-            if not row:
-                return None
-            return {
-                "telegram_id": row["telegram_id"],
-                "api_key": row["api_key"],
-                "api_secret": row["api_secret"],
-                "status": row["status"],
-            }
+            self._touch_user(
+                conn,
+                telegram_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+            )
+            return self._cached_credentials(conn, telegram_id)
+
+    def record_user_and_get_state(
+        self,
+        telegram_id: int,
+        *,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+    ) -> Tuple[Optional[Dict[str, Optional[str]]], Optional[Dict[str, Any]]]:
+        with self._lock, self._connection() as conn:
+            self._touch_user(
+                conn,
+                telegram_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+            )
+            return self._cached_credentials(conn, telegram_id), self._select_entry_draft(conn, telegram_id)
+
+    def get_credentials(self, telegram_id: int) -> Optional[Dict[str, Optional[str]]]:
+        with self._lock:
+            return self._cached_credentials(None, telegram_id)
 
     def store_api_key(self, telegram_id: int, api_key: str) -> None:
         now = _utcnow()
         with self._lock, self._connection() as conn:
+            self._credentials_cache.pop(telegram_id, None)
             conn.execute(
                 """
                 INSERT INTO credentials (telegram_id, api_key, api_secret, status, updated_at)
@@ -137,6 +255,7 @@ class StockStorage:
         now = _utcnow()
         status = "active" if verified else "pending_secret"
         with self._lock, self._connection() as conn:
+            self._credentials_cache.pop(telegram_id, None)
             conn.execute(
                 """
                 INSERT INTO credentials (telegram_id, api_key, api_secret, status, updated_at)
@@ -152,6 +271,7 @@ class StockStorage:
     def reset_credentials(self, telegram_id: int) -> None:
         now = _utcnow()
         with self._lock, self._connection() as conn:
+            self._credentials_cache.pop(telegram_id, None)
             conn.execute(
                 """
                 UPDATE credentials
@@ -167,35 +287,71 @@ class StockStorage:
     # --------------------------------------------- entry drafts
     def get_entry_draft(self, telegram_id: int) -> Optional[Dict[str, Any]]:
         with self._lock, self._connection() as conn:
-            row = conn.execute(
-                "SELECT payload FROM entry_drafts WHERE telegram_id = ?",
-                (telegram_id,),
-            ).fetchone()
-            if not row:
-                return None
-            try:
-                return json.loads(row["payload"])
-            except json.JSONDecodeError:
-                return None
+            return self._select_entry_draft(conn, telegram_id)
 
     def save_entry_draft(self, telegram_id: int, payload: Dict[str, Any]) -> None:
+        data = orjson.dumps(payload)
+        moment = time.monotonic()
+        with self._lock:
+            saved = self._saved_drafts
+            previous = saved.get(telegram_id)
+            if previous and previous[0] == data and moment - previous[1] < DRAFT_REFRESH_SECONDS:
+                return
+            now = _utcnow()
+            with self._connection() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO entry_drafts (telegram_id, payload, updated_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(telegram_id) DO UPDATE
+                    SET payload = excluded.payload,
+                        updated_at = excluded.updated_at
+                    """,
+                    (telegram_id, data.decode(), now),
+                )
+            saved[telegram_id] = (data, moment)
+            saved.move_to_end(telegram_id)
+            if len(saved) > CREDENTIALS_CACHE_SIZE:
+                saved.popitem(last=False)
+
+    def update_entry_draft_stage(self, telegram_id: int, stage: str) -> None:
         now = _utcnow()
-        data = json.dumps(payload)
         with self._lock, self._connection() as conn:
+            self._saved_drafts.pop(telegram_id, None)
             conn.execute(
                 """
-                INSERT INTO entry_drafts (telegram_id, payload, updated_at)
-                VALUES (?, ?, ?)
-                ON CONFLICT(telegram_id) DO UPDATE
-                SET payload = excluded.payload,
-                    updated_at = excluded.updated_at
+                UPDATE entry_drafts
+                SET payload = json_set(payload, '$.stage', ?),
+                    updated_at = ?
+                WHERE telegram_id = ?
                 """,
-                (telegram_id, data, now),
+                (stage, now, telegram_id),
             )
 
     def delete_entry_draft(self, telegram_id: int) -> None:
         with self._lock, self._connection() as conn:
+            self._saved_drafts.pop(telegram_id, None)
+            conn.execute(
+                "DELETE FROM entry_drafts WHERE telegram_id = ?",
+                (telegram_id,),
+            )
+
+    def delete_stale_entry_drafts(self, max_age: timedelta) -> int:
+        cutoff = _utcnow(max_age)
+        with self._lock, self._connection() as conn:
+            self._saved_drafts.clear()
+            cursor = conn.execute(
+                "DELETE FROM entry_drafts WHERE updated_at < ?",
+                (cutoff,),
+            )
+            return cursor.rowcount
+
+    def pop_entry_draft(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connection() as conn:
+            self._saved_drafts.pop(telegram_id, None)
+            draft = self._select_entry_draft(conn, telegram_id)
             conn.execute(
                 "DELETE FROM entry_drafts WHERE telegram_id = ?",
                 (telegram_id,),
             )
+            return draft